@@ -25,9 +25,15 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import argparse
+import asyncio
 import datetime as dt
+import json
 import os
+import tempfile
+import time
 from collections import Counter
+from collections import defaultdict
+from types import SimpleNamespace
 
 import aiohttp
 import discord
@@ -46,8 +52,11 @@ PATH_LIST = ['data', 'activity']
 PATH = os.path.join(*PATH_LIST)
 JSON = os.path.join(*PATH_LIST, "settings.json")
 DB = os.path.join(*PATH_LIST, "db.json")
+STORE_PATH = os.path.join(*PATH_LIST, "store")
 HOST = '127.0.0.1'
 INTERVAL = 5
+CONTENT_RETENTION_DAYS = 7
+ROLLUP_MEMORY_DAYS = 7
 
 
 class DateTimeSerializer(Serializer):
@@ -64,6 +73,187 @@ serialization = SerializationMiddleware(JSONStorage)
 serialization.register_serializer(DateTimeSerializer(), 'TinyDate')
 
 
+class SettingsCache:
+    """In-memory cache for per-key settings read from storage.
+
+    Values are loaded with loader(key) on first access and kept until
+    invalidate() is called for that key, so hot paths such as on_message
+    do not hit storage on every call. Any command which writes the
+    underlying settings must invalidate the key it changed.
+    """
+
+    def __init__(self, loader):
+        self.loader = loader
+        self.cache = {}
+
+    def get(self, key):
+        try:
+            return self.cache[key]
+        except KeyError:
+            value = self.cache[key] = self.loader(key)
+            return value
+
+    def invalidate(self, key=None):
+        """Drop one key, or everything if key is None."""
+        if key is None:
+            self.cache.clear()
+        else:
+            self.cache.pop(key, None)
+
+
+class ActivityStore:
+    """Append-only message log with hourly rollup counters.
+
+    Layout under the store path:
+    - messages-YYYYMMDD.log: one JSON line per message, no content
+    - content-YYYYMMDD.log: one JSON line per message content,
+      deleted after the content retention period
+    - rollup-YYYYMMDD.json: hour -> "server_id:channel_id:author_id" -> count
+
+    Writes are buffered in memory and appended by flush().
+    Queries are served from the rollups only.
+    """
+
+    def __init__(self, path, content_retention_days=CONTENT_RETENTION_DAYS):
+        self.path = path
+        self.content_retention_days = content_retention_days
+        self.pending_messages = defaultdict(list)
+        self.pending_content = defaultdict(list)
+        self.rollups = {}
+        self.dirty_days = set()
+        if not os.path.exists(self.path):
+            os.makedirs(self.path)
+
+    @staticmethod
+    def day_key(timestamp: dt.datetime):
+        return timestamp.strftime('%Y%m%d')
+
+    @staticmethod
+    def hour_key(timestamp: dt.datetime):
+        return timestamp.strftime('%H')
+
+    def file_path(self, prefix, day, ext='log'):
+        return os.path.join(self.path, '{}-{}.{}'.format(prefix, day, ext))
+
+    def rollup(self, day):
+        """Hourly rollups for a day, loaded from disk on first access."""
+        if day not in self.rollups:
+            path = self.file_path('rollup', day, ext='json')
+            rollup = defaultdict(Counter)
+            if os.path.exists(path):
+                with open(path) as f:
+                    for hour, counts in json.load(f).items():
+                        rollup[hour].update(counts)
+            self.rollups[day] = rollup
+        return self.rollups[day]
+
+    def append(self, server_id, channel_id, author_id, timestamp: dt.datetime,
+               bot=False, message_id=None, content=None):
+        """Log one message."""
+        day = self.day_key(timestamp)
+        self.pending_messages[day].append({
+            'message_id': message_id,
+            'author_id': author_id,
+            'server_id': server_id,
+            'channel_id': channel_id,
+            'timestamp': timestamp.strftime('%Y-%m-%dT%H:%M:%S'),
+            'bot': bot
+        })
+        if content is not None and self.content_retention_days > 0:
+            self.pending_content[day].append({
+                'message_id': message_id,
+                'content': content
+            })
+        key = '{}:{}:{}'.format(server_id, channel_id, author_id)
+        self.rollup(day)[self.hour_key(timestamp)][key] += 1
+        self.dirty_days.add(day)
+
+    def flush(self):
+        """Append pending lines to segments and save dirty rollups."""
+        for prefix, pending in (('messages', self.pending_messages), ('content', self.pending_content)):
+            for day, lines in pending.items():
+                with open(self.file_path(prefix, day), 'a') as f:
+                    f.write(''.join(json.dumps(line) + '\n' for line in lines))
+            pending.clear()
+
+        for day in self.dirty_days:
+            dataIO.save_json(self.file_path('rollup', day, ext='json'), self.rollups[day])
+        self.dirty_days.clear()
+
+    def prune_content(self, now=None):
+        """Delete content segments older than the retention period."""
+        if now is None:
+            now = dt.datetime.utcnow()
+        cutoff = self.day_key(now - dt.timedelta(days=self.content_retention_days))
+        for filename in os.listdir(self.path):
+            if not filename.startswith('content-'):
+                continue
+            day = filename[len('content-'):-len('.log')]
+            if day < cutoff or self.content_retention_days <= 0:
+                os.remove(os.path.join(self.path, filename))
+
+    def evict_rollups(self, now=None):
+        """Unload saved rollups older than ROLLUP_MEMORY_DAYS.
+
+        They are read from disk again if a query needs them.
+        """
+        if now is None:
+            now = dt.datetime.utcnow()
+        cutoff = self.day_key(now - dt.timedelta(days=ROLLUP_MEMORY_DAYS))
+        for day in list(self.rollups):
+            if day < cutoff and day not in self.dirty_days:
+                del self.rollups[day]
+
+    def counts(self, from_date: dt.datetime, group_by,
+               server_id=None, channel_id=None, author_id=None, to_date=None):
+        """Message counts since from_date grouped by server, channel or author.
+
+        :param group_by: one of 'server', 'channel', 'author'
+        :return: Counter of id -> message count
+        """
+        if to_date is None:
+            to_date = dt.datetime.utcnow()
+        index = ['server', 'channel', 'author'].index(group_by)
+        filters = [server_id, channel_id, author_id]
+
+        from_day, from_hour = self.day_key(from_date), self.hour_key(from_date)
+        to_day, to_hour = self.day_key(to_date), self.hour_key(to_date)
+
+        result = Counter()
+        day = from_date.replace(hour=0, minute=0, second=0, microsecond=0)
+        while self.day_key(day) <= to_day:
+            key = self.day_key(day)
+            day += dt.timedelta(days=1)
+            if key not in self.rollups and not os.path.exists(self.file_path('rollup', key, ext='json')):
+                continue
+            for hour, counts in self.rollup(key).items():
+                if key == from_day and hour < from_hour:
+                    continue
+                if key == to_day and hour > to_hour:
+                    continue
+                for triple, count in counts.items():
+                    ids = triple.split(':')
+                    if any(f is not None and f != i for f, i in zip(filters, ids)):
+                        continue
+                    result[ids[index]] += count
+        return result
+
+    def migrate_tinydb(self, table):
+        """Import messages from the legacy TinyDB messages table.
+
+        :return: number of messages imported
+        """
+        count = 0
+        for r in table.all():
+            self.append(
+                r['server_id'], r['channel_id'], r['author_id'], r['timestamp'],
+                bot=r.get('bot', False), content=r.get('message_content')
+            )
+            count += 1
+        self.flush()
+        return count
+
+
 class Activity:
     """Activity Logger.
 
@@ -96,15 +286,44 @@ class Activity:
         )
         self.table_settings = self.db.table('settings')
         self.table_messages = self.db.table('messages')
+        self.server_settings = SettingsCache(self.load_server_settings)
+        self.store = ActivityStore(
+            STORE_PATH,
+            content_retention_days=self.settings.get('content_retention_days', CONTENT_RETENTION_DAYS)
+        )
+        self.task = self.bot.loop.create_task(self.loop_task())
 
     def __unload(self):
         self.lock = True
+        self.task.cancel()
+        self.store.flush()
         self.session.close()
 
+    async def loop_task(self):
+        """Flush the message log every INTERVAL seconds.
+
+        Expired message content is pruned and old rollups are unloaded
+        once a day.
+        """
+        pruned_day = None
+        while self == self.bot.get_cog("Activity"):
+            self.store.flush()
+            today = self.store.day_key(dt.datetime.utcnow())
+            if today != pruned_day:
+                self.store.prune_content()
+                self.store.evict_rollups()
+                pruned_day = today
+            await asyncio.sleep(INTERVAL)
+
     def save_json(self):
         """Save settings."""
         dataIO.save_json(JSON, self.settings)
 
+    def load_server_settings(self, server_id):
+        """Server settings from the database, None if not set."""
+        Settings = Query()
+        return self.table_settings.get(Settings.server_id == server_id)
+
     @commands.group(pass_context=True)
     @checks.mod_or_permissions()
     async def activityset(self, ctx: Context):
@@ -129,10 +348,64 @@ class Activity:
             on_off = not r['on_off']
 
         db.upsert({'server_id': server_id, 'on_off': on_off}, Settings.server_id == server_id)
+        self.server_settings.invalidate(server_id)
 
         await self.bot.say("Monitor server activity: {}".format(on_off))
 
+    @activityset.command(name="retention", pass_context=True)
+    @checks.is_owner()
+    async def as_retention(self, ctx, days: int):
+        """Set number of days to keep message content. 0 to disable."""
+        self.settings['content_retention_days'] = days
+        self.save_json()
+        self.store.content_retention_days = days
+        self.store.prune_content()
+        await self.bot.say("Message content retention set to {} days.".format(days))
+
+    @activityset.command(name="migrate", pass_context=True)
+    @checks.is_owner()
+    async def as_migrate(self, ctx):
+        """Migrate messages from the legacy TinyDB database."""
+        await self.bot.type()
+        count = self.store.migrate_tinydb(self.table_messages)
+        self.db.purge_table('messages')
+        self.table_messages = self.db.table('messages')
+        await self.bot.say("Migrated {} messages.".format(count))
+
+    @activityset.command(name="benchmark", pass_context=True, no_pm=True)
+    @checks.is_owner()
+    async def as_benchmark(self, ctx, count: int = 10000):
+        """Measure per-message overhead of on_message.
 
+        Runs against a temporary store so logged activity is not affected.
+        """
+        await self.bot.type()
+        message = SimpleNamespace(
+            id='0', content='benchmark',
+            server=ctx.message.server,
+            channel=ctx.message.channel,
+            author=ctx.message.author
+        )
+        server_id = ctx.message.server.id
+        store = self.store
+        out = []
+        with tempfile.TemporaryDirectory() as path:
+            self.store = ActivityStore(path, content_retention_days=store.content_retention_days)
+            try:
+                for name, cached in (('uncached', False), ('cached', True)):
+                    start = time.perf_counter()
+                    for _ in range(count):
+                        if not cached:
+                            self.server_settings.invalidate(server_id)
+                        await self.on_message(message)
+                    elapsed = time.perf_counter() - start
+                    out.append('{:<10}: {:>8.2f} µs / message'.format(name, elapsed / count * 1e6))
+                start = time.perf_counter()
+                self.store.flush()
+                out.append('{:<10}: {:>8.2f} µs / message'.format('flush', (time.perf_counter() - start) / count * 1e6))
+            finally:
+                self.store = store
+        await self.bot.say(box('\n'.join(out), lang='py'))
 
     def parser(self, cat):
         """Argument parser."""
@@ -214,15 +487,9 @@ class Activity:
 
         from_date = dt.datetime.utcnow() - dt.timedelta(days=days)
 
-        Msg = Query()
-
-        results = self.db.search(
-            (Msg.server_id == server.id)
-            & (Msg.author_id == member.id)
-            & (Msg.timestamp >= from_date)
-        )
-        channel_ids = [r['channel_id'] for r in results]
-        channel_id_mc = Counter(channel_ids).most_common()
+        channel_id_mc = self.store.counts(
+            from_date, 'channel', server_id=server.id, author_id=member.id
+        ).most_common()
 
         await self.bot.say(
             self.output_str(
@@ -253,13 +520,9 @@ class Activity:
 
         from_date = dt.datetime.utcnow() - dt.timedelta(days=days)
 
-        Msg = Query()
-        results = self.db.search(
-            (Msg.channel_id == channel.id)
-            & (Msg.timestamp >= from_date)
-        )
-        author_ids = [r['author_id'] for r in results]
-        author_id_mc = Counter(author_ids).most_common()
+        author_id_mc = self.store.counts(
+            from_date, 'author', server_id=server.id, channel_id=channel.id
+        ).most_common()
 
         # Limit members by roles
         mc = []
@@ -303,16 +566,9 @@ class Activity:
         server = ctx.message.server
         from_date = dt.datetime.utcnow() - dt.timedelta(days=days)
 
-        Msg = Query()
-        results = self.db.search(
-            (Msg.server_id == server.id)
-            & (Msg.timestamp >= from_date)
-        )
-        authors = []
-        for r in results:
-            authors.append(r['author_id'])
-
-        mc_authors = Counter(authors).most_common(limit)
+        mc_authors = self.store.counts(
+            from_date, 'author', server_id=server.id
+        ).most_common(limit)
 
         await self.bot.say(
             self.output_str(
@@ -334,22 +590,16 @@ class Activity:
         if channel is None:
             return
 
-        Settings = Query()
-        db = self.table_settings
-        r = db.get(Settings.server_id == server.id)
+        r = self.server_settings.get(server.id)
 
         if r is not None:
             if not r['on_off']:
                 return
 
-        self.table_messages.insert({
-            'author_id': author.id,
-            'server_id': server.id,
-            'channel_id': channel.id,
-            'message_content': message.content,
-            'timestamp': dt.datetime.utcnow(),
-            'bot': author.bot
-        })
+        self.store.append(
+            server.id, channel.id, author.id, dt.datetime.utcnow(),
+            bot=author.bot, message_id=message.id, content=message.content
+        )
 
 
 def check_folders():
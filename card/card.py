@@ -32,7 +32,8 @@ from cogs.utils.chat_formatting import pagify, box
 from discord.ext import commands
 from discord.ext.commands import Context
 from itertools import islice
-from matplotlib import pyplot as plt
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
 from random import choice
 import datetime
 import asyncio
@@ -43,23 +44,26 @@ import os
 import re
 import string
 import pprint
-import statistics
+from collections import Counter
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
 
 from .deck import Deck
-from collections import namedtuple
 
 
 settings_path = "data/card/settings.json"
 crdata_path = "data/card/clashroyale.json"
-cardpop_path = "data/card/cardpop.json"
+cardpop_path = "data/card/cardpop.npz"
 crtexts_path = "data/card/crtexts.json"
 dates_path = "data/card/dates.json"
 
 CARDPOP_DATA_PATH = os.path.join("data", "crdata")
 CARDPOP_JSON_PROG = re.compile('cardpop-\d{4}-\d{2}-\d{2}-\d{2}.json')
 
-cardpop_range_min = 8
-cardpop_range_max = 26
+# seconds between checks for new card popularity data
+CARDPOP_RELOAD_INTERVAL = 60
 
 max_deck_show = 5
 
@@ -67,12 +71,277 @@ PAGINATION_TIMEOUT = 20.0
 
 discord_ui_bgcolor = discord.Color(value=int('36393e', 16))
 
+PLOT_WORKERS = 1
+PLOT_CACHE_SIZE = 128
+# number of most requested cards to render trend plots for on load
+PLOT_PRECOMPUTE = 20
+
+PLOT_THEMES = {
+    "cardtrend": dict(
+        facecolor='#32363b',
+        edgecolor='#eeeeee',
+        spinecolor='#999999',
+        footercolor='#999999',
+        labelcolor='#cccccc',
+        tickcolor='#999999',
+        titlecolor='#ffffff',
+    ),
+    "elixirtrend": dict(
+        facecolor='#32363b',
+        edgecolor='#333333',
+        spinecolor='#666666',
+        footercolor='#999999',
+        labelcolor='#cccccc',
+        tickcolor='#999999',
+        titlecolor='#ffffff',
+    ),
+}
+
 
 def take(n, iterable):
     """Return first n items of the iterable as a list."""
     return list(islice(iterable, n))
 
 
+def plot_figure(theme, title, xlabel, ylabel):
+    """Figure and axes styled with theme colors."""
+    fig = Figure(
+        figsize=(8, 6),
+        dpi=192,
+        facecolor=theme["facecolor"],
+        edgecolor=theme["edgecolor"])
+    FigureCanvasAgg(fig)
+
+    ax = fig.add_subplot(111)
+
+    ax.set_title(title, color=theme["titlecolor"])
+    ax.set_xlabel(xlabel)
+    ax.set_ylabel(ylabel)
+
+    for spine in ax.spines.values():
+        spine.set_edgecolor(theme["spinecolor"])
+
+    ax.xaxis.label.set_color(theme["labelcolor"])
+    ax.yaxis.label.set_color(theme["labelcolor"])
+    ax.tick_params(axis='x', colors=theme["tickcolor"])
+    ax.tick_params(axis='y', colors=theme["tickcolor"])
+    return fig, ax
+
+
+def plot_png(fig, ax, theme):
+    """Add legend and footer and return figure as PNG bytes."""
+    leg = ax.legend(facecolor=theme["facecolor"], edgecolor=theme["spinecolor"])
+    for text in leg.get_texts():
+        text.set_color(theme["labelcolor"])
+
+    ax.annotate(
+        'Compiled with data from Woody’s popularity snapshots',
+        xy=(0, 0),
+        xycoords=('figure fraction'),
+        xytext=(15, 10),
+        textcoords='offset points',
+        size=8, ha='left', va='bottom', color=theme["footercolor"])
+
+    fig.subplots_adjust(left=0.1, right=0.96, top=0.9, bottom=0.2)
+
+    with io.BytesIO() as f:
+        fig.savefig(f, format="png", facecolor=theme["facecolor"],
+                    edgecolor=theme["edgecolor"], transparent=True)
+        return f.getvalue()
+
+
+def render_cardtrend_png(series, labels):
+    """Plot card usage over snapshots. Runs in plot worker.
+
+    :param series: list of (label, x, y)
+    :param labels: x tick labels
+    """
+    theme = PLOT_THEMES["cardtrend"]
+    fig, ax = plot_figure(theme, 'Clash Royale Card Trends', 'Snapshots', 'Usage')
+    ax.grid(True, alpha=0.3)
+    for label, x, y in series:
+        ax.plot(x, y, 'o-', label=label)
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=70, fontsize=8, ha='right')
+    return plot_png(fig, ax, theme)
+
+
+def render_elixirtrend_png(deck_x, deck_y, deck_area, x, labels, stats):
+    """Plot deck elixir over snapshots. Runs in plot worker."""
+    theme = PLOT_THEMES["elixirtrend"]
+    fig, ax = plot_figure(theme, 'Clash Royale Decks: Average Elixir Trends', 'Snapshots', 'Elixir')
+    ax.scatter(deck_x, deck_y, s=deck_area, c="yellow")
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=70, fontsize=8, ha='right')
+    for p, y in stats.items():
+        ax.plot(x, y, 'o-', label=string.capwords(p))
+    return plot_png(fig, ax, theme)
+
+
+class PlotService:
+    """Render plots in a worker process and cache the PNGs.
+
+    The snapshot data only changes on ingestion, so cached plots stay
+    valid until clear() is called.
+    """
+
+    def __init__(self, loop, workers=PLOT_WORKERS, cache_size=PLOT_CACHE_SIZE):
+        self.loop = loop
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.pending = {}
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    def clear(self):
+        self.cache.clear()
+
+    async def render(self, key, func, args):
+        """Return cached PNG for key, or render func(*args()) in worker.
+
+        args is only called on cache miss. Concurrent requests for the same
+        key share one render.
+        """
+        png = self.cache.get(key)
+        if png is not None:
+            self.cache.move_to_end(key)
+            return png
+        future = self.pending.get(key)
+        if future is None:
+            future = self.loop.run_in_executor(self.pool, func, *args())
+            self.pending[key] = future
+        try:
+            png = await asyncio.shield(future)
+        finally:
+            self.pending.pop(key, None)
+        self.cache[key] = png
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return png
+
+
+class CardPopStore:
+    """Columnar card popularity data loaded from cardpop.npz.
+
+    Built by card/data/scripts/cardpopstore.py. Cards and snapshots are
+    rows and columns of count matrices; decks are rows of a card index
+    table, grouped by snapshot.
+    """
+
+    def __init__(self, path):
+        with np.load(path) as data:
+            self.cards = data["cards"].tolist()
+            self.snapshots = data["snapshots"].tolist()
+            self.counts = data["counts"]
+            self.changes = data["changes"]
+            self.present = data["present"]
+            self.deck_offsets = data["deck_offsets"]
+            self.deck_cards = data["deck_cards"]
+            self.deck_count = data["deck_count"]
+            self.deck_elixir = data["deck_elixir"]
+        self.card_index = {card: i for i, card in enumerate(self.cards)}
+        self.snapshot_index = {str(s): j for j, s in enumerate(self.snapshots)}
+        self.deck_rows = {
+            (str(self.snapshots[j]), self.deck_key(row)): row
+            for j in range(len(self.snapshots))
+            for row in self.snapshot_deck_rows(self.snapshots[j])
+        }
+        self.card_decks = [self.build_card_decks(j) for j in range(len(self.snapshots))]
+
+    def build_card_decks(self, j):
+        """Posting lists of a snapshot: card index -> sorted array of deck rows."""
+        start, stop = self.deck_offsets[j], self.deck_offsets[j + 1]
+        cards = self.deck_cards[start:stop].ravel()
+        rows = np.repeat(np.arange(start, stop), self.deck_cards.shape[1])
+        order = np.argsort(cards, kind="stable")
+        cards, rows = cards[order], rows[order]
+        keys, splits = np.unique(cards, return_index=True)
+        return dict(zip(keys.tolist(), np.split(rows, splits[1:])))
+
+    def has_snapshot(self, snapshot_id):
+        return str(snapshot_id) in self.snapshot_index
+
+    def snapshot_columns(self, snapshot_ids):
+        return [self.snapshot_index[str(s)] for s in snapshot_ids]
+
+    def card_counts(self, card, snapshot_ids):
+        """Counts of a card across snapshots as an array."""
+        i = self.card_index.get(card)
+        if i is None:
+            return np.zeros(len(snapshot_ids), dtype=self.counts.dtype)
+        return self.counts[i, self.snapshot_columns(snapshot_ids)]
+
+    def card_stat(self, card, snapshot_id):
+        """(count, change) of a card in a snapshot, None if not in snapshot."""
+        i = self.card_index.get(card)
+        j = self.snapshot_index.get(str(snapshot_id))
+        if i is None or j is None or not self.present[i, j]:
+            return None
+        return int(self.counts[i, j]), int(self.changes[i, j])
+
+    def snapshot_cards(self, snapshot_id):
+        """List of (card, count, change) in a snapshot, most popular first."""
+        j = self.snapshot_index[str(snapshot_id)]
+        rows = np.flatnonzero(self.present[:, j])
+        rows = rows[np.argsort(-self.counts[rows, j], kind="stable")]
+        return [(self.cards[i], int(self.counts[i, j]), int(self.changes[i, j])) for i in rows]
+
+    def snapshot_deck_rows(self, snapshot_id):
+        """Deck rows of a snapshot, most popular first."""
+        j = self.snapshot_index[str(snapshot_id)]
+        return range(self.deck_offsets[j], self.deck_offsets[j + 1])
+
+    def decks_with_cards(self, snapshot_id, cards):
+        """Deck rows of a snapshot containing all cards, most popular first.
+
+        Intersects posting lists, shortest first.
+        """
+        j = self.snapshot_index[str(snapshot_id)]
+        postings = []
+        for card in set(cards):
+            rows = self.card_decks[j].get(self.card_index.get(card))
+            if rows is None:
+                return []
+            postings.append(rows)
+        if not postings:
+            return list(self.snapshot_deck_rows(snapshot_id))
+        postings.sort(key=len)
+        found = postings[0]
+        for rows in postings[1:]:
+            found = np.intersect1d(found, rows, assume_unique=True)
+            if not len(found):
+                break
+        # deck rows are stored by popularity
+        return found.tolist()
+
+    def deck_card_keys(self, row):
+        return [self.cards[i] for i in self.deck_cards[row]]
+
+    def deck_key(self, row):
+        """Deck id used in cardpop.json: sorted card keys joined by comma."""
+        return ', '.join(self.cards[i] for i in self.deck_cards[row])
+
+    def deck_pop_count(self, deck_key, snapshot_id):
+        row = self.deck_rows.get((str(snapshot_id), deck_key))
+        if row is None:
+            return 0
+        return int(self.deck_count[row])
+
+    def elixir_stats(self):
+        """Weighted mean and median deck elixir per snapshot, as arrays."""
+        means = []
+        medians = []
+        for j in range(len(self.snapshots)):
+            rows = slice(self.deck_offsets[j], self.deck_offsets[j + 1])
+            count = self.deck_count[rows]
+            elixir = self.deck_elixir[rows]
+            means.append(np.average(elixir, weights=count))
+            medians.append(np.median(np.repeat(elixir, count)))
+        return np.array(means), np.array(medians)
+
+
 class Card:
     """Clash Royale Card Popularity snapshots."""
 
@@ -86,7 +355,7 @@ class Card:
 
         self.settings = dataIO.load_json(self.file_path)
         self.crdata = dataIO.load_json(self.crdata_path)
-        self.cardpop = dataIO.load_json(self.cardpop_path)
+        self.cardpop = CardPopStore(self.cardpop_path)
         self.crtexts = dataIO.load_json(self.crtexts_path)
         self.dates = dataIO.load_json(self.dates_path)
 
@@ -114,8 +383,35 @@ class Card:
         self.card_thumb_w = int(self.card_w * self.card_thumb_scale)
         self.card_thumb_h = int(self.card_h * self.card_thumb_scale)
 
-        self.plotfigure = 0
-        self.plot_lock = asyncio.Lock()
+        self.plot_service = PlotService(self.bot.loop)
+        self.trend_requests = Counter(self.settings.get("TrendRequests", {}))
+        self.cardpop_mtime = os.path.getmtime(self.cardpop_path)
+        self.bot.loop.create_task(self.precompute_cardtrends())
+        self.bot.loop.create_task(self.cardpop_reload_task())
+
+    def __unload(self):
+        self.plot_service.shutdown()
+        self.settings["TrendRequests"] = dict(self.trend_requests)
+        dataIO.save_json(self.file_path, self.settings)
+
+    async def cardpop_reload_task(self):
+        """Reload card popularity data when the ingestion script updates it."""
+        while self == self.bot.get_cog("Card"):
+            await asyncio.sleep(CARDPOP_RELOAD_INTERVAL)
+            try:
+                mtime = os.path.getmtime(self.cardpop_path)
+            except OSError:
+                continue
+            if mtime != self.cardpop_mtime:
+                self.reload_cardpop()
+                self.cardpop_mtime = mtime
+                await self.precompute_cardtrends()
+
+    def reload_cardpop(self):
+        """Load new snapshots and drop plots made from old ones."""
+        self.cardpop = CardPopStore(self.cardpop_path)
+        self.dates = dataIO.load_json(self.dates_path)
+        self.plot_service.clear()
 
     @commands.command(pass_context=True)
     async def card(self, ctx, card=None):
@@ -185,9 +481,9 @@ class Card:
             cards = cards[:-1]
 
         if snapshot_id is None:
-            snapshot_id = str(cardpop_range_max - 1)
+            snapshot_id = str(self.cardpop.snapshots[-1])
 
-        is_most_recent_snapshot = int(snapshot_id) == cardpop_range_max - 1
+        is_most_recent_snapshot = int(snapshot_id) == self.cardpop.snapshots[-1]
 
         # await self.bot.say("{}: {}".format(snapshot_id, cards))
 
@@ -205,14 +501,8 @@ class Card:
         # cpids = [self.get_card_cpid(c) for c in cards]
 
         found_decks = []
-        if snapshot_id in self.cardpop:
-            decks = self.cardpop[snapshot_id]["decks"]
-            for k in decks.keys():
-                deck = decks[k]["deck"]
-                if all(card in deck for card in cards):
-                    found_decks.append(k)
-                # if all(cpid in k for cpid in cpids):
-                #     found_decks.append(k)
+        if self.cardpop.has_snapshot(snapshot_id):
+            found_decks = self.cardpop.decks_with_cards(snapshot_id, cards)
 
         await self.bot.say("Found {} decks with {} in Snapshot #{}{}.".format(
             len(found_decks),
@@ -225,48 +515,21 @@ class Card:
             #     "Listing top {} decks:".format(
             #         min([max_deck_show, len(found_decks)])))
 
-            for i, deck in enumerate(found_decks):
-                # Show top 5 deck images only
-                # if i < max_deck_show:
-
-                results_max = 3
-
-                cards = deck.split(', ')
-                norm_cards = [self.get_card_from_cpid(c) for c in cards]
-
-                await self.bot.say("**{}**: {}/100: {}".format(
-                    i + 1,
-                    self.get_deckpop_count(deck, snapshot_id),
-                    self.card_to_str(deck)))
-
-                FakeMember = namedtuple("FakeMember", "name")
-                m = FakeMember(name="Snapshot #{}".format(snapshot_id))
-
-                await self.bot.get_cog("Deck").deck_get_helper(
-                    ctx,
-                    card1=norm_cards[0],
-                    card2=norm_cards[1],
-                    card3=norm_cards[2],
-                    card4=norm_cards[3],
-                    card5=norm_cards[4],
-                    card6=norm_cards[5],
-                    card7=norm_cards[6],
-                    card8=norm_cards[7],
+            entries = []
+            for i, row in enumerate(found_decks):
+                deck = self.cardpop.deck_key(row)
+                norm_cards = [self.get_card_from_cpid(c) for c in self.cardpop.deck_card_keys(row)]
+                entries.append(dict(
+                    deck=norm_cards,
                     deck_name="Top Deck: {}".format(i + 1),
-                    author=m)
-
-                if (i + 1) % results_max == 0 and (i + 1) < len(found_decks):
-                    def pagination_check(m):
-                        return m.content.lower() == 'y'
-                    await self.bot.say(
-                        "Would you like to see more results? (y/n)")
-                    answer = await self.bot.wait_for_message(
-                        timeout=PAGINATION_TIMEOUT,
-                        author=ctx.message.author,
-                        check=pagination_check)
-                    if answer is None:
-                        await self.bot.say("Search results aborted.")
-                        return
+                    deck_author="Snapshot #{}".format(snapshot_id),
+                    description="**{}**: {}/100: {}".format(
+                        i + 1,
+                        int(self.cardpop.deck_count[row]),
+                        self.card_to_str(deck))
+                ))
+
+            await self.bot.get_cog("Deck").deck_grid_menu(ctx, entries)
 
     @commands.command(pass_context=True)
     async def cardimage(self, ctx, card=None):
@@ -315,118 +578,63 @@ class Card:
                 validated_cards.append(card)
 
         if len(validated_cards) == len(cards):
-
-            facecolor = '#32363b'
-            edgecolor = '#eeeeee'
-            spinecolor = '#999999'
-            footercolor = '#999999'
-            labelcolor = '#cccccc'
-            tickcolor = '#999999'
-            titlecolor = '#ffffff'
-
-            fig = plt.figure(
-                num=1,
-                figsize=(8, 6),
-                dpi=192,
-                facecolor=facecolor,
-                edgecolor=edgecolor)
-            plt.grid(b=True, alpha=0.3)
-
-            ax = fig.add_subplot(111)
-
-            ax.set_title('Clash Royale Card Trends', color=titlecolor)
-            ax.set_xlabel('Snapshots')
-            ax.set_ylabel('Usage')
-
-            for spine in ax.spines.values():
-                spine.set_edgecolor(spinecolor)
-
-            ax.xaxis.label.set_color(labelcolor)
-            ax.yaxis.label.set_color(labelcolor)
-            ax.tick_params(axis='x', colors=tickcolor)
-            ax.tick_params(axis='y', colors=tickcolor)
-
-            # create labels using snapshot dates
-            labels = []
-            for id in range(cardpop_range_min, cardpop_range_max):
-                dt = datetime.datetime.strptime(
-                    self.dates[str(id)], '%Y-%m-%d')
-                dtstr = dt.strftime('%b %d, %y')
-                labels.append("{}\n   {}".format(id, dtstr))
-
             # process plot only when all the cards are valid
-            for card in validated_cards:
-
-                x = range(cardpop_range_min, cardpop_range_max)
-                y = [int(self.get_cardpop_count(card, id)) for id in x]
-                ax.plot(x, y, 'o-', label=self.card_to_str(card))
-                plt.xticks(x, labels, rotation=70, fontsize=8, ha='right')
-
-            # make tick label font size smaller
-            # for tick in ax.xaxis.get_major_ticks():
-            #     tick.label.set_fontsize(8)
-
-            leg = ax.legend(facecolor=facecolor, edgecolor=spinecolor)
-            for text in leg.get_texts():
-                text.set_color(labelcolor)
-
-            ax.annotate(
-                'Compiled with data from Woody’s popularity snapshots',
-
-                # The point that we'll place the text in relation to
-                xy=(0, 0),
-                # Interpret the x as axes coords, and the y as figure
-                # coords
-                xycoords=('figure fraction'),
-
-                # The distance from the point that the text will be at
-                xytext=(15, 10),
-                # Interpret `xytext` as an offset in points...
-                textcoords='offset points',
-
-                # Any other text parameters we'd like
-                size=8, ha='left', va='bottom', color=footercolor)
-
-            plt.subplots_adjust(left=0.1, right=0.96, top=0.9, bottom=0.2)
+            png = await self.cardtrend_png(validated_cards)
 
             plot_filename = "{}-plot.png".format("-".join(cards))
-            # plot_name = "Card Trends: {}".format(
-            #     ", ".join([self.card_to_str(c) for c in validated_cards]))
             plot_name = ""
 
-            with io.BytesIO() as f:
-                plt.savefig(f, format="png", facecolor=facecolor,
-                            edgecolor=edgecolor, transparent=True)
-                f.seek(0)
+            with io.BytesIO(png) as f:
                 await ctx.bot.send_file(
                     ctx.message.channel, f,
                     filename=plot_filename,
                     content=plot_name)
 
-            fig.clf()
-
-        plt.clf()
-        plt.cla()
+    def snapshot_labels(self, snapshot_ids):
+        """Plot tick labels using snapshot dates."""
+        labels = []
+        for id in snapshot_ids:
+            dt = datetime.datetime.strptime(
+                self.dates[str(id)], '%Y-%m-%d')
+            dtstr = dt.strftime('%b %d, %y')
+            labels.append("{}\n   {}".format(id, dtstr))
+        return labels
+
+    async def cardtrend_png(self, cards):
+        """Card trend plot as PNG bytes, cached by card set and snapshot range."""
+        cards = sorted(cards)
+        store = self.cardpop
+        snapshot_range = (store.snapshots[0], store.snapshots[-1] + 1)
+        key = ("cardtrend", tuple(cards), snapshot_range, "dark")
+        self.trend_requests.update(cards)
+
+        def args():
+            x = store.snapshots
+            series = [
+                (self.card_to_str(card), x, store.card_counts(card, x).tolist())
+                for card in cards
+            ]
+            return series, self.snapshot_labels(x)
+
+        return await self.plot_service.render(key, render_cardtrend_png, args)
+
+    async def precompute_cardtrends(self):
+        """Render trend plots of the most requested cards into the plot cache."""
+        for card, _ in self.trend_requests.most_common(PLOT_PRECOMPUTE):
+            if card in self.cards:
+                await self.cardtrend_png([card])
 
     @commands.command(pass_context=True)
     async def elixirlist(self, ctx: Context):
         """Display average elixir over time."""
-        trend = {}
-
-        for snapshot_id, snapshot in self.cardpop.items():
-            decks = snapshot["decks"]
-            deck_count = 0
-            elixir_all = 0
-            for deck_id, deck_v in decks.items():
-                deck_count += deck_v["count"]
-                elixir_all += deck_v["count"] * deck_v["elixir"]
-            trend[snapshot_id] = elixir_all / deck_count
+        means, _ = self.cardpop.elixir_stats()
+        trend = dict(zip(self.cardpop.snapshots, means))
 
         out = []
-        for id in range(cardpop_range_min, cardpop_range_max):
+        for id in self.cardpop.snapshots:
             out.append(
                 "Snapshot {:2}: {}"
-                "".format(id, trend[str(id)]))
+                "".format(id, trend[id]))
 
         await self.bot.say(
             "```python\n" +
@@ -436,152 +644,52 @@ class Card:
     @commands.command(pass_context=True)
     async def elixirtrend(self, ctx: Context):
         """Plot elixir trend over time."""
-        # sorted by snapshot id
-        trend = {}
-        # unsorted as list of dict
-        trendall = []
-        stats = []
-
-        for snapshot_id, snapshot in self.cardpop.items():
-            decks = snapshot["decks"]
-            # deck_id = 0
-
-            if snapshot_id not in trend:
-                trend[snapshot_id] = []
-
-            for deck_key, deck_v in decks.items():
-                trend[snapshot_id].append({
-                    "elixir": deck_v["elixir"],
-                    "count": deck_v["count"]
-                })
-                trendall.append({
-                    "id": snapshot_id,
-                    "elixir": deck_v["elixir"],
-                    "count": deck_v["count"]
-                })
-
-            # expand count to list for statistics
-            trendstat = []
-            for t in trend[snapshot_id]:
-                trendstat.extend([t["elixir"]] * t["count"])
-            stats.append({
-                "id": snapshot_id,
-                "trend": trendstat,
-                "median": statistics.median(trendstat),
-                "mean": statistics.mean(trendstat)
-            })
-            # print (str(trendstat))
-
-        # Colors
-        facecolor = '#32363b'
-        edgecolor = '#333333'
-        spinecolor = '#666666'
-        footercolor = '#999999'
-        labelcolor = '#cccccc'
-        tickcolor = '#999999'
-        titlecolor = '#ffffff'
-
-        fig = plt.figure(
-            num=1,
-            figsize=(8, 6),
-            dpi=192,
-            facecolor=facecolor,
-            edgecolor=edgecolor)
-        # plt.grid(b=True, alpha=1)
-
-        ax = fig.add_subplot(111)
-
-        ax.set_title(
-            'Clash Royale Decks: Average Elixir Trends', color=titlecolor)
-        ax.set_xlabel('Snapshots')
-        ax.set_ylabel('Elixir')
-
-        for spine in ax.spines.values():
-            spine.set_edgecolor(spinecolor)
-
-        ax.xaxis.label.set_color(labelcolor)
-        ax.yaxis.label.set_color(labelcolor)
-        ax.tick_params(axis='x', colors=tickcolor)
-        ax.tick_params(axis='y', colors=tickcolor)
-
-        # create labels using snapshot dates
-        labels = []
-        # for id in range(cardpop_range_min, cardpop_range_max):
-        for t in trendall:
-            dt = datetime.datetime.strptime(
-                self.dates[str(t["id"])], '%Y-%m-%d')
-            dtstr = dt.strftime('%b %d, %y')
-            labels.append("{}\n   {}".format(t["id"], dtstr))
-
-        # cmap=plt.get_cmap(name)
-        # scatter plot datapoints
-        x = [int(t["id"]) for t in trendall]
-        y = [t["elixir"] for t in trendall]
-        area = [t["count"] * 2 for t in trendall]
-        # ax.scatter(x, y, s=area, c="np.arange(100)", cmap="plasma")
-        ax.scatter(x, y, s=area, c="yellow")
-        plt.xticks(x, labels, rotation=70, fontsize=8, ha='right')
-
-        # plot mean and median
-        for p in ["mean", "median"]:
-            x = [s["id"] for s in stats]
-            y = [s[p] for s in stats]
-            ax.plot(x, y, 'o-', label=string.capwords(p))
-
-        leg = ax.legend(facecolor=facecolor, edgecolor=spinecolor)
-        for text in leg.get_texts():
-            text.set_color(labelcolor)
-
-        ax.annotate(
-            'Compiled with data from Woody’s popularity snapshots',
-            xy=(0, 0),
-            xycoords=('figure fraction'),
-            xytext=(15, 10),
-            textcoords='offset points',
-            size=8, ha='left', va='bottom', color=footercolor)
-
-        plt.subplots_adjust(left=0.1, right=0.96, top=0.9, bottom=0.2)
+        store = self.cardpop
+        snapshots = store.snapshots
+        key = ("elixirtrend", (snapshots[0], snapshots[-1] + 1), "dark")
+
+        def args():
+            # snapshot id of every deck row
+            deck_snapshots = np.repeat(store.snapshots, np.diff(store.deck_offsets))
+            means, medians = store.elixir_stats()
+            stats = OrderedDict([("mean", means.tolist()), ("median", medians.tolist())])
+            return (
+                deck_snapshots.tolist(), store.deck_elixir.tolist(),
+                (store.deck_count * 2).tolist(),
+                snapshots, self.snapshot_labels(snapshots), stats)
+
+        png = await self.plot_service.render(key, render_elixirtrend_png, args)
 
         plot_filename = "elixir-trend-plot.png"
-        # plot_name = "Card Trends: {}".format(
-        #     ", ".join([self.card_to_str(c) for c in validated_cards]))
         plot_name = ""
 
-        with io.BytesIO() as f:
-            plt.savefig(f, format="png", facecolor=facecolor,
-                        edgecolor=edgecolor, transparent=True)
-            f.seek(0)
+        with io.BytesIO(png) as f:
             await ctx.bot.send_file(
                 ctx.message.channel, f,
                 filename=plot_filename,
                 content=plot_name)
 
-        fig.clf()
-        plt.clf()
-        plt.cla()
-
-
     @commands.command(pass_context=True)
     async def popdata(self, ctx: Context,
-        snapshot_id=str(cardpop_range_max - 1), limit=10):
+        snapshot_id=None, limit=10):
         """Display raw data of the card popularity snapshot."""
+        store = self.cardpop
+        if snapshot_id is None:
+            snapshot_id = str(store.snapshots[-1])
+
         if not snapshot_id.isdigit():
             await self.bot.say("Please enter a number for the snapshot id.")
             return
 
-        if not cardpop_range_min <= int(snapshot_id) < cardpop_range_max:
+        if not store.has_snapshot(snapshot_id):
             await self.bot.say("Snapshot ID must be between {} and {}.".format(
-                cardpop_range_min, cardpop_range_max - 1))
+                store.snapshots[0], store.snapshots[-1]))
             return
 
         limit = int(limit)
         if limit <= 0:
             limit = 10000
 
-        snapshot = self.cardpop[snapshot_id]
-        cards = snapshot["cardpop"]
-        decks = snapshot["decks"]
-
         dt = datetime.datetime.strptime(
             self.dates[str(snapshot_id)], '%Y-%m-%d')
         dtstr = dt.strftime('%b %d, %Y')
@@ -591,26 +699,26 @@ class Card:
 
         await self.bot.say("**Cards:**")
         out = []
-        for card_key, card_value in take(limit, cards.items()):
+        for card_key, count, change in take(limit, store.snapshot_cards(snapshot_id)):
             out.append("{:4d} ({:3d}) {}".format(
-                card_value["count"],
-                card_value["change"],
+                count,
+                change,
                 self.card_to_str(card_key)))
         for page in pagify("\n".join(out), shorten_by=12):
             await self.bot.say(box(page, lang="py"))
 
         await self.bot.say("**Decks:**")
         out = []
-        for deck_key, deck_value in take(limit, decks.items()):
+        for row in take(limit, store.snapshot_deck_rows(snapshot_id)):
             out.append("**{:4d}**: {}".format(
-                deck_value["count"],
-                self.card_to_str(deck_key)))
+                store.deck_count[row],
+                self.card_to_str(store.deck_key(row))))
         for page in pagify("\n".join(out), shorten_by=12):
             await self.bot.say(page)
 
     @commands.command(pass_content=True)
     async def popdataall(self, ctx: Context,
-        snapshot_id=str(cardpop_range_max - 1)):
+        snapshot_id=None):
         """Display raw data of card popularity snapshot without limits."""
         pass
 
@@ -656,13 +764,10 @@ class Card:
     def get_cardpop_count(self, card=None, snapshot_id=None):
         """Return card popularity count by snapshot id."""
         out = 0
-        snapshot_id = str(snapshot_id)
         if card is not None and snapshot_id is not None:
-            if snapshot_id in self.cardpop:
-                cardpop = self.cardpop[snapshot_id]["cardpop"]
-                cpid = self.get_card_cpid(card)
-                if cpid in cardpop:
-                    out = cardpop[cpid]["count"]
+            stat = self.cardpop.card_stat(self.get_card_cpid(card), snapshot_id)
+            if stat is not None:
+                out = stat[0]
         return out
 
     def get_cardpop(self, card=None, snapshot_id=None):
@@ -671,16 +776,11 @@ class Card:
         Format: Count (Change)
         """
         out = "---"
-        snapshot_id = str(snapshot_id)
 
         if card is not None and snapshot_id is not None:
-            if snapshot_id in self.cardpop:
-                cardpop = self.cardpop[snapshot_id]["cardpop"]
-                cpid = self.get_card_cpid(card)
-                if cpid in cardpop:
-                    out = "**{}** ({})".format(
-                        cardpop[cpid]["count"],
-                        cardpop[cpid]["change"])
+            stat = self.cardpop.card_stat(self.get_card_cpid(card), snapshot_id)
+            if stat is not None:
+                out = "**{}** ({})".format(*stat)
         return out
 
     def get_card_cpid(self, card=None):
@@ -698,13 +798,7 @@ class Card:
 
     def get_deckpop_count(self, deck=None, snapshot_id=None):
         """Return the deck popularity by snapshot id."""
-        out = 0
-        snapshot_id = str(snapshot_id)
-        if snapshot_id in self.cardpop:
-            decks = self.cardpop[snapshot_id]["decks"]
-            if deck in decks:
-                out = decks[deck]["count"]
-        return out
+        return self.cardpop.deck_pop_count(deck, snapshot_id)
 
 
 def check_folder():
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+The MIT License (MIT)
+
+Copyright (c) 2017 SML
+
+Permission is hereby granted, free of charge, to any person obtaining a
+copy of this software and associated documentation files (the "Software"),
+to deal in the Software without restriction, including without limitation
+the rights to use, copy, modify, merge, publish, distribute, sublicense,
+and/or sell copies of the Software, and to permit persons to whom the
+Software is furnished to do so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS
+OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
+FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
+DEALINGS IN THE SOFTWARE.
+"""
+
+# Convert cardpop.json into the columnar cardpop.npz used by the card cog.
+#
+# Arrays:
+# - cards: card keys, sorted
+# - snapshots: snapshot ids
+# - counts, changes, present: card x snapshot matrices
+# - deck_offsets: decks of snapshot i are rows deck_offsets[i]:deck_offsets[i + 1]
+# - deck_cards: deck x 8 card indices, sorted
+# - deck_count, deck_elixir: per deck
+
+import json
+import os
+
+import numpy as np
+
+cardpop_path = '../cardpop.json'
+cardpop_npz_path = '../cardpop.npz'
+
+DECK_SIZE = 8
+
+
+def load_json(filename=None):
+    with open(filename, encoding='utf-8', mode="r") as f:
+        json_data = json.load(f)
+    return json_data
+
+
+def build_store(data):
+    """Return dict of arrays from cardpop.json data."""
+    snapshots = sorted(int(k) for k in data.keys())
+    cards = set()
+    for snapshot in data.values():
+        cards.update(snapshot["cardpop"].keys())
+        for deck in snapshot["decks"].values():
+            cards.update(deck["deck"])
+    cards = sorted(cards)
+    card_index = {card: i for i, card in enumerate(cards)}
+
+    shape = (len(cards), len(snapshots))
+    counts = np.zeros(shape, dtype=np.int16)
+    changes = np.zeros(shape, dtype=np.int16)
+    present = np.zeros(shape, dtype=bool)
+
+    deck_offsets = [0]
+    deck_cards = []
+    deck_count = []
+    deck_elixir = []
+
+    for j, snapshot_id in enumerate(snapshots):
+        snapshot = data[str(snapshot_id)]
+        for card, v in snapshot["cardpop"].items():
+            i = card_index[card]
+            counts[i, j] = v["count"]
+            changes[i, j] = v["change"]
+            present[i, j] = True
+        # decks are stored by popularity
+        for deck in snapshot["decks"].values():
+            deck_cards.append(sorted(card_index[card] for card in deck["deck"]))
+            deck_count.append(deck["count"])
+            deck_elixir.append(deck["elixir"])
+        deck_offsets.append(len(deck_cards))
+
+    return dict(
+        cards=np.array(cards),
+        snapshots=np.array(snapshots, dtype=np.int16),
+        counts=counts,
+        changes=changes,
+        present=present,
+        deck_offsets=np.array(deck_offsets, dtype=np.int32),
+        deck_cards=np.array(deck_cards, dtype=np.int16).reshape(-1, DECK_SIZE),
+        deck_count=np.array(deck_count, dtype=np.int16),
+        deck_elixir=np.array(deck_elixir, dtype=np.float32),
+    )
+
+
+def save_store(filename, store):
+    # write to temp file first so the cog never loads a partial file
+    tmp = filename + '.tmp.npz'
+    np.savez_compressed(tmp, **store)
+    os.replace(tmp, filename)
+
+
+def main():
+    save_store(cardpop_npz_path, build_store(load_json(cardpop_path)))
+
+
+if __name__ == '__main__':
+    main()
@@ -24,192 +24,306 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
-from openpyxl import load_workbook
+# Incremental ingestion of Woody’s popularity snapshots.
+#
+# Only snapshot workbooks that are new or changed since the last run are
+# parsed, in a process pool. Header names are normalized to card keys with a
+# persistent alias table so fuzzy matching runs once per new name. Writes
+# cardpop.json, summary.txt, dates.json and cardpop.npz; the card cog reloads
+# cardpop.npz when it changes.
+#
+# Usage: python popdata.py [--full] [--workers N] [--min N] [--max N]
+
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
+import argparse
+import hashlib
 import json
+import os
+import re
+import sys
+
+from openpyxl import load_workbook
 
+from cardpopstore import build_store, save_store
+from popdates import snapshot_date
+
+cardpop_xlsx_dir = '../xlsx'
 cardpop_xlsx_path = '../xlsx/cardpop{}.xlsx'
-cardpop_json_path = '../cardpop{}.json'
+cardpop_xlsx_re = re.compile(r'^cardpop(\d+)\.xlsx$')
 cardpop_path = '../cardpop.json'
+cardpop_npz_path = '../cardpop.npz'
 summary_path = '../summary.txt'
 crdata_path = '../clashroyale.json'
+dates_path = '../dates.json'
+aliases_path = '../aliases.json'
+ingest_path = '../ingest.json'
 
+# snapshot 7 has a different layout
 cardpop_range_min = 8
-cardpop_range_max = 26
-
-similarity_threshold = 0.85
 
-data = {}
+# rows 2-101 are player decks
+snapshot_players = 100
 
-out = []
-card_elixir = {}
+similarity_threshold = 0.85
 
 
-def load_json(filename=None):
+def load_json(filename=None, default=None):
+    if default is not None and not os.path.exists(filename):
+        return default
     with open(filename, encoding='utf-8', mode="r") as f:
         json_data = json.load(f)
     return json_data
 
 def save_json(filename=None, data=None):
-    with open(filename, encoding='utf-8', mode='w') as f:
+    # write to temp file first so readers never see a partial file
+    tmp = filename + '.tmp'
+    with open(tmp, encoding='utf-8', mode='w') as f:
         json.dump(data, f, indent=4, sort_keys=False, separators=(',',' : '))
-
-
-crdata = load_json(crdata_path)
-
-cpid_dict = {}
-
-def cpid2id(cpid=None):
-    if cpid is None:
-        return ""
-    if cpid in cpid_dict:
-        return cpid_dict[cpid]
-    for card_id, card_v in crdata["Cards"].items():
-        cpid_dict[card_v["cpid"]] = card_id
-    return cpid_dict[cpid]
-
-def get_card_elixir(id=None):
-    """Return card elixir with cpid."""
-    # if cpid is None:
-    #     return 0
-    # if cpid in card_elixir:
-    #     return card_elixir[cpid]
-    # for card_id, card_v in crdata["Cards"].items():
-    #     card_elixir[card_v["cpid"]] = card_v["elixir"]
-    # return card_elixir[cpid]
-
-    return crdata["Cards"][id]["elixir"]
-
-def get_deck_elixir(deck):
-    """Calculate average elixir in a deck.
-
-    Decks are in CPID so need to find from crdata"""
-    # for card in deck:
+    os.replace(tmp, filename)
+
+def save_text(filename, text):
+    tmp = filename + '.tmp'
+    with open(tmp, encoding='utf-8', mode='w') as f:
+        f.write(text)
+    os.replace(tmp, filename)
+
+
+def find_snapshot_ids(min_id=None, max_id=None):
+    """Snapshot ids of the workbooks in the xlsx folder."""
+    ids = []
+    for filename in os.listdir(cardpop_xlsx_dir):
+        m = cardpop_xlsx_re.match(filename)
+        if m is None:
+            continue
+        id = int(m.group(1))
+        if (min_id is None or id >= min_id) and (max_id is None or id <= max_id):
+            ids.append(id)
+    return sorted(ids)
+
+
+class AliasTable:
+    """Map snapshot header names to card keys.
+
+    Exact matches on cpid are tried first, then fuzzy matches on cpid and
+    card key. Results are remembered in aliases.json.
+    """
+
+    def __init__(self, crdata, aliases):
+        self.crdata = crdata
+        self.aliases = aliases
+        self.cpids = {v["cpid"]: k for k, v in crdata["Cards"].items()}
+        self.changed = False
+
+    @staticmethod
+    def simplify(name):
+        return re.sub(r'[^a-z0-9]', '', name.lower())
+
+    def match(self, name):
+        if name in self.cpids:
+            return self.cpids[name]
+        simple = self.simplify(name)
+        best, best_ratio = None, 0
+        for cpid, card_key in self.cpids.items():
+            for candidate in (cpid, card_key):
+                ratio = SequenceMatcher(a=simple, b=self.simplify(candidate)).ratio()
+                if ratio > best_ratio:
+                    best, best_ratio = card_key, ratio
+        if best_ratio < similarity_threshold:
+            raise KeyError("No card matches snapshot header {!r}".format(name))
+        return best
+
+    def card_key(self, name):
+        if name not in self.aliases:
+            self.aliases[name] = self.match(name)
+            self.changed = True
+            print("Alias: {} -> {}".format(name, self.aliases[name]))
+        return self.aliases[name]
+
+
+def file_signature(path):
+    with open(path, mode='rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def read_snapshot(path):
+    """Return (header names, card columns of each player row) of a workbook.
+
+    The first sheet either has card names in the first row and 1 where a
+    player uses a card, or an empty first row and the card names of one
+    deck per row. Runs in worker processes.
+    """
+    wb = load_workbook(path, read_only=True)
+    ws = wb.worksheets[0]
+    sheet = list(ws.iter_rows(max_row=snapshot_players + 1, values_only=True))
+    wb.close()
+    names = list(sheet[0][1:]) if sheet else []
+    header = []
+    rows = []
+    if any(name is not None for name in names):
+        # skip columns without a card name
+        columns = [j for j, name in enumerate(names, 1) if name is not None]
+        header = [sheet[0][j] for j in columns]
+        for row in sheet[1:]:
+            rows.append([k for k, j in enumerate(columns) if j < len(row) and row[j] == 1])
+    else:
+        index = {}
+        for row in sheet[1:]:
+            deck = []
+            for name in row[1:]:
+                if name is None:
+                    continue
+                if name not in index:
+                    index[name] = len(header)
+                    header.append(name)
+                deck.append(index[name])
+            rows.append(deck)
+    return header, rows
+
+
+def get_deck_elixir(crdata, deck):
+    """Calculate average elixir in a deck."""
     elixir = 0
     for card in deck:
-        elixir += get_card_elixir(card)
+        elixir += crdata["Cards"][card]["elixir"]
     return elixir/8
 
 
-
-def process_data():
-
-    prev_cardpop = None
-
-
-
-    for id in range(cardpop_range_min, cardpop_range_max):
-
-        wb = load_workbook(cardpop_xlsx_path.format(id))
-
-        ws = wb.worksheets[0]
-
-        cards = []
-        players = []
-        cardpop = {}
-        decks = {}
-
+def build_snapshot(crdata, aliases, header, rows):
+    """Snapshot data in cardpop.json format, without card changes."""
+    cards = [aliases.card_key(name) for name in header]
+    players = []
+    cardpop = {card: {"count": 0, "change": 0} for card in cards}
+    decks = {}
+
+    for rank, columns in enumerate(rows, 1):
+        deck = sorted(cards[j] for j in columns)
+        for card in deck:
+            cardpop[card]["count"] += 1
+
+        # Create deck count
+        if len(deck):
+            players.append({
+                "rank": rank,
+                "deck": deck
+            })
+
+            deck_id = ', '.join(deck)
+
+            # populate unique decks
+            if deck_id not in decks:
+                decks[deck_id] = {
+                    "id": deck_id,
+                    "deck": deck,
+                    "count": 1,
+                    "elixir": get_deck_elixir(crdata, deck),
+                    "similarity": {}
+                    }
+            else:
+                decks[deck_id]["count"] += 1
+
+    decks = dict(sorted(decks.items(), key = lambda x: -x[1]["count"]))
+    cardpop = dict(sorted(cardpop.items(), key = lambda x: -x[1]["count"]))
+
+    return {
+        "players": players,
+        "cards": sorted(cards),
+        "decks": decks,
+        "cardpop": cardpop
+        }
+
+
+def update_changes(data, snapshot_ids):
+    """Set card changes of snapshots from the snapshot before."""
+    for id in snapshot_ids:
+        prev = data.get(str(id - 1))
+        for k, v in data[str(id)]["cardpop"].items():
+            # verify card exists previously as some cards may be new
+            if prev is not None and k in prev["cardpop"]:
+                v["change"] = v["count"] - prev["cardpop"][k]["count"]
+            else:
+                v["change"] = 0
+
+
+def summary(data):
+    out = []
+    for id in sorted(data, key=int):
+        snapshot = data[id]
         out.append("-" * 80)
         out.append("Snapshot #{}".format(id))
-
-        for i, row in enumerate(ws.iter_rows()):
-            # first row is card names
-            if i==0:
-                for j, cell in enumerate(row):
-                    if j:
-                        card_id = cpid2id(cell.value)
-                        cards.append(card_id)
-                        cardpop[card_id] = {
-                            "count": 0,
-                            "change": 0
-                        }
-            # row 2-101 are card data
-            # for older worksheets, it’s len - 2
-            elif i<101:
-                deck = []
-                for j, cell in enumerate(row):
-                    if j>0 and cell.value == 1:
-                        card_id = cards[j-1]
-                        # card_id = cpid2id(card_name)
-                        deck.append(card_id)
-                        cardpop[card_id]["count"] += 1
-
-                deck = sorted(deck)
-                player = {
-                    "rank": i,
-                    "deck": deck
-                }
-
-                # Create deck count
-                if len(deck):
-                    players.append(player)
-
-                    deck_id = ', '.join(deck)
-
-                    # populate unique decks
-                    if deck_id not in decks:
-                        decks[deck_id] = {
-                            "id": deck_id,
-                            "deck": deck,
-                            "count": 1,
-                            "elixir": get_deck_elixir(deck),
-                            "similarity": {}
-                            }
-                    else:
-                        decks[deck_id]["count"] += 1
-
-        # calculate change
-        if prev_cardpop is not None:
-            for k, v in cardpop.items():
-                # verify card exists previously as some cards may be new
-                if k in prev_cardpop:
-                    v["change"] = v["count"] - prev_cardpop[k]["count"]
-
-
-        decks = dict(sorted(decks.items(), key = lambda x: -x[1]["count"]))
-        cardpop = dict(sorted(cardpop.items(), key = lambda x: -x[1]["count"]))
-
-        # calculate similarity
-        # for k, deck in decks.items():
-        #     similarity = {}
-        #     for j, deck2 in decks.items():
-        #         if k != j:
-        #             similarity[j] = SequenceMatcher(a=k, b=j).ratio()
-        #     similarity = dict(sorted(similarity.items(), key = lambda x: -x[1]))
-        #     deck["similarity"] = similarity
-
-        prev_cardpop = cardpop
-
         out.append("Decks:")
-        # out.append("Deck similarity threshold: {}".format(similarity_threshold))
-        for k, deck in decks.items():
+        for k, deck in snapshot["decks"].items():
             out.append("{:3d}: {}".format(deck["count"], k))
-            # output similarity over threshold
-            # for sk, sv in deck["similarity"].items():
-            #     if sv > similarity_threshold:
-            #         out.append("        {:3f}: {}".format(sv, sk))
-
         out.append("Cards:")
-        for k, v in cardpop.items():
+        for k, v in snapshot["cardpop"].items():
             out.append("{:3d} ({:3d}): {}".format(v["count"], v["change"], k))
-
-        data[str(id)] = {
-            "players": players,
-            "cards": sorted(cards),
-            "decks": decks,
-            "cardpop": cardpop
-            }
+    return '\n'.join(out)
+
+
+def process_data(snapshot_ids, full=False, workers=None):
+    crdata = load_json(crdata_path)
+    data = {} if full else load_json(cardpop_path, {})
+    ingested = {} if full else load_json(ingest_path, {})
+    aliases = AliasTable(crdata, load_json(aliases_path, {}))
+    dates = load_json(dates_path, {})
+
+    # only parse new or modified workbooks
+    paths = {}
+    for id in snapshot_ids:
+        path = cardpop_xlsx_path.format(id)
+        if not os.path.exists(path):
+            continue
+        if str(id) in data and ingested.get(str(id)) == file_signature(path):
+            continue
+        paths[id] = path
+
+    if not paths:
+        print("No new snapshots.")
+        return
+
+    ids = sorted(paths)
+    print("Parsing snapshots: {}".format(', '.join(str(id) for id in ids)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parsed = executor.map(read_snapshot, [paths[id] for id in ids])
+        for id, (header, rows) in zip(ids, parsed):
+            data[str(id)] = build_snapshot(crdata, aliases, header, rows)
+            ingested[str(id)] = file_signature(paths[id])
+            if str(id) not in dates:
+                dates[str(id)] = snapshot_date(id).isoformat()
+
+    # changes of the snapshot after a new one depend on it too
+    update_changes(data, sorted(set(ids) | {id + 1 for id in ids if str(id + 1) in data}))
+
+    data = {id: data[id] for id in sorted(data, key=int)}
+    dates = {id: dates[id] for id in sorted(dates, key=int)}
 
     save_json(cardpop_path, data)
-
-    with open(summary_path, encoding="utf-8", mode="w") as f:
-        f.write('\n'.join(out))
-
-process_data()
-
-
-
-
-
-
-
+    save_json(dates_path, dates)
+    save_text(summary_path, summary(data))
+    # written last: the card cog reloads when this file changes
+    save_store(cardpop_npz_path, build_store(data))
+
+    if aliases.changed:
+        save_json(aliases_path, aliases.aliases)
+    save_json(ingest_path, ingested)
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(
+        description="Ingest card popularity snapshots.")
+    parser.add_argument(
+        '--full', help='Reprocess all snapshots', action='store_true')
+    parser.add_argument(
+        '--workers', '-w', help='Worker processes', type=int, default=None)
+    parser.add_argument(
+        '--min', help='First snapshot id', type=int, default=cardpop_range_min)
+    parser.add_argument(
+        '--max', help='Last snapshot id, defaults to the newest workbook', type=int, default=None)
+    args = parser.parse_args(arguments)
+
+    process_data(
+        find_snapshot_ids(args.min, args.max), full=args.full, workers=args.workers)
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -38,14 +38,19 @@ def save_json(filename=None, data=None):
         json.dump(data, f, indent=4, sort_keys=False, separators=(',',' : '))
 
 
+def snapshot_date(id):
+    """Snapshots are taken every two weeks."""
+    season_days = (id - cardpop_range_min) * 14
+    season_timedelta = datetime.timedelta(days=season_days)
+    return cardpop_min_date + season_timedelta
+
+
 def process_data():
 
     dates = {}
 
     for id in range(cardpop_range_min, cardpop_range_max):
-        season_days = (id - cardpop_range_min) * 14
-        season_timedelta = datetime.timedelta(days=season_days)
-        dates[str(id)] = cardpop_min_date + season_timedelta
+        dates[str(id)] = snapshot_date(id)
 
     # id = 23
     # dates = {}
@@ -64,11 +69,5 @@ def process_data():
     save_json(data_path, data)
 
 
-process_data()
-
-
-
-
-
-
-
+if __name__ == '__main__':
+    process_data()
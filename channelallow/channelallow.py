@@ -25,6 +25,7 @@ DEALINGS IN THE SOFTWARE.
 from collections import defaultdict
 
 import discord
+import logging
 import os
 from cogs.utils import checks
 from cogs.utils.dataIO import dataIO
@@ -32,15 +33,80 @@ from discord.ext import commands
 
 import re
 
+logger = logging.getLogger(__name__)
+
 PATH = os.path.join("data", "channelallow")
 JSON = os.path.join(PATH, "settings.json")
 
+# Rules applied regardless of server settings: channel id -> rule settings
+DEFAULT_RULES = {
+    # '553917858694823954': dict(  # rr-test2
+    '550405517223395338': dict(  # friendlinks on racf
+        allow=[
+            r'https://link.clashroyale.com/invite/friend/..\?tag=([A-Z0-9]+)&token=([a-z0-9]+)&platform=([A-Za-z0-9]+)',
+        ],
+        deny=[]
+    ),
+}
+
 
 def nested_dict():
     """Recursively nested defaultdict."""
     return defaultdict(nested_dict)
 
 
+# Patterns that change meaning inside an alternation: global inline flags
+# and backreferences, which are renumbered by the other patterns' groups.
+STANDALONE_RE = re.compile(r'^\(\?[aiLmsux]+\)|\\[1-9]|\(\?P=')
+
+
+def compile_alternation(patterns):
+    """Compile patterns into as few regexes as possible, None if there are none.
+
+    Patterns are combined into one alternation, except those that only
+    work on their own, which are compiled separately.
+    """
+    if not patterns:
+        return None
+    combined = [p for p in patterns if not STANDALONE_RE.search(p)]
+    standalone = [p for p in patterns if STANDALONE_RE.search(p)]
+    regexes = []
+    if combined:
+        try:
+            regexes.append(re.compile('|'.join('(?:{})'.format(p) for p in combined)))
+        except re.error:
+            standalone = patterns
+            regexes = []
+    regexes.extend(re.compile(p) for p in standalone)
+    return regexes
+
+
+class ChannelRule:
+    """Compiled allow / deny patterns for a channel.
+
+    A message is allowed if it matches none of the deny patterns and,
+    when allow patterns are set, at least one of them.
+    """
+
+    def __init__(self, allow=None, deny=None):
+        self.allow = compile_alternation(allow)
+        self.deny = compile_alternation(deny)
+
+    @classmethod
+    def from_settings(cls, settings):
+        # Legacy settings store a single allow regex as a string
+        if isinstance(settings, str):
+            return cls(allow=[settings])
+        return cls(allow=settings.get('allow'), deny=settings.get('deny'))
+
+    def allows(self, content):
+        if self.deny is not None and any(r.search(content) for r in self.deny):
+            return False
+        if self.allow is not None and not any(r.search(content) for r in self.allow):
+            return False
+        return True
+
+
 class ChannelAlow:
     """Remove messages that don’t contain specific text or regex in channel."""
 
@@ -49,31 +115,102 @@ class ChannelAlow:
         self.bot = bot
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(JSON))
+        self.rules = {}
+        self.build_rules()
 
     def check_server(self, server):
         if server.id not in self.settings:
             self.settings[server.id] = {}
             dataIO.save_json(JSON, self.settings)
 
+    def build_rules(self):
+        """Compile rules for all channels."""
+        self.rules = {
+            channel_id: ChannelRule.from_settings(settings)
+            for channel_id, settings in DEFAULT_RULES.items()
+        }
+        for server_id, channels in self.settings.items():
+            for channel_id, settings in channels.items():
+                try:
+                    self.update_rule(server_id, channel_id)
+                except re.error:
+                    # invalid saved patterns should not stop the cog from loading
+                    self.rules[channel_id] = self.valid_rule(server_id, channel_id, settings)
+
+    def valid_rule(self, server_id, channel_id, settings):
+        """Rule from the saved patterns that compile, logging the others."""
+        if isinstance(settings, str):
+            settings = dict(allow=[settings], deny=[])
+        patterns = {}
+        for key in ('allow', 'deny'):
+            patterns[key] = []
+            for pattern in settings.get(key) or []:
+                try:
+                    re.compile(pattern)
+                except re.error as e:
+                    logger.error(
+                        "Ignoring invalid %s pattern %r in server %s channel %s: %s",
+                        key, pattern, server_id, channel_id, e)
+                else:
+                    patterns[key].append(pattern)
+        return ChannelRule(allow=patterns['allow'], deny=patterns['deny'])
+
+    def update_rule(self, server_id, channel_id):
+        """Recompile rule for a channel after its settings change."""
+        settings = self.settings[server_id].get(channel_id)
+        if settings:
+            self.rules[channel_id] = ChannelRule.from_settings(settings)
+        elif channel_id in DEFAULT_RULES:
+            self.rules[channel_id] = ChannelRule.from_settings(DEFAULT_RULES[channel_id])
+        else:
+            self.rules.pop(channel_id, None)
+
+    def get_channel_settings(self, server, channel):
+        """Channel settings as allow / deny lists."""
+        self.check_server(server)
+        settings = self.settings[server.id].get(channel.id)
+        if isinstance(settings, str):
+            settings = dict(allow=[settings], deny=[])
+        elif not settings:
+            settings = dict(allow=[], deny=[])
+        self.settings[server.id][channel.id] = settings
+        return settings
+
+    async def add_pattern(self, server, channel, key, regex):
+        settings = self.get_channel_settings(server, channel)
+        patterns = settings[key] + [regex] if regex not in settings[key] else settings[key]
+        try:
+            compile_alternation(patterns)
+        except re.error as e:
+            await self.bot.say("Invalid regex: {}".format(e))
+            return
+        settings[key] = patterns
+        dataIO.save_json(JSON, self.settings)
+        self.update_rule(server.id, channel.id)
+        await self.bot.say("Added {} rule to {}.".format(key, channel.mention))
+
     @commands.group(pass_context=True)
     @checks.mod_or_permissions()
     async def channelallow(self, ctx):
         """channeel allow settings"""
         if ctx.invoked_subcommand is None:
-            await self.bot.send_cmd_help()
+            await self.bot.send_cmd_help(ctx)
 
-    @channelallow.command(name="add", pass_context=True)
+    @channelallow.command(name="add", pass_context=True, aliases=["allow"])
     @checks.mod_or_permissions()
     async def add(self, ctx, regex, channel: discord.Channel = None):
-        """Add regex to channel"""
+        """Add regex to channel. Messages must match one of these."""
         if channel is None:
             channel = ctx.message.channel
+        await self.add_pattern(ctx.message.server, channel, 'allow', regex)
 
-        server = ctx.messge.server
-        self.check_server(server)
-
-        self.settings[server.id][channel.id] = regex
-        dataIO.save_json(JSON, self.settings)
+    @channelallow.command(name="deny", pass_context=True)
+    @checks.mod_or_permissions()
+    async def deny(self, ctx, regex, channel: discord.Channel = None):
+        """Add deny regex to channel. Messages matching this are removed."""
+        if channel is None:
+            channel = ctx.message.channel
+        await self.add_pattern(ctx.message.server, channel, 'deny', regex)
 
     @channelallow.command(name="remove", pass_context=True, aliases=["rm", "del"])
     @checks.mod_or_permissions()
@@ -87,52 +224,20 @@ class ChannelAlow:
 
         self.settings[server.id].pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
+        self.update_rule(server.id, channel.id)
 
     async def on_message(self, msg):
-        """Handle messages.
-
-        For testing, only run on specific channels
-        """
-
-        # if not self == self.bot.get_cog("ChannelAllow"):
-        #     return
-
-        s = dict(
-            friendlink=dict(
-                regex='https://link.clashroyale.com/invite/friend/..\?tag=([A-Z0-9]+)&token=([a-z0-9]+)&platform=([A-Za-z0-9]+)',
-                channel_ids=[
-                    # '553917858694823954',  # rr-test2
-                    '550405517223395338',  # friendlinks on racf
-                ]
-            )
-        )
-        if msg.channel.id not in s['friendlink']['channel_ids']:
+        """Handle messages."""
+        rule = self.rules.get(msg.channel.id)
+        if rule is None:
             return
 
         # ignore bots
         if msg.author.bot:
             return
 
-        for k, v in s.items():
-            if msg.channel.id in v.get('channel_ids'):
-                m = re.search(v.get('regex'),  msg.content)
-                if not m:
-                    await self.bot.delete_message(msg)
-                    return
-
-        #
-        # server = msg.server
-        # if server not in self.settings:
-        #     return
-        #
-        # channel = msg.channel
-        # self.check_server(server)
-        # if channel.id not in self.settings[server.id]:
-        #     return
-        #
-        # regex = self.settings[server.id][channel.id]
-        # if not regex:
-        #     return
+        if not rule.allows(msg.content):
+            await self.bot.delete_message(msg)
 
 
 def check_folder():
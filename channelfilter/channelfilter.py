@@ -25,10 +25,15 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import os
+import random
+import string
+import time
 from collections import defaultdict
+from collections import deque
 
 import discord
 from cogs.utils import checks
+from cogs.utils.chat_formatting import box
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 
@@ -41,6 +46,64 @@ def nested_dict():
     return defaultdict(nested_dict)
 
 
+class WordMatcher:
+    """Aho-Corasick automaton for case-insensitive substring matching.
+
+    Built once from a word list, then scans each message in a single pass
+    regardless of how many words are filtered.
+    """
+
+    def __init__(self, words):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [None]
+        for word in words:
+            self.add(word.lower())
+        self.build()
+
+    def add(self, word):
+        if not word:
+            return
+        node = 0
+        for char in word:
+            next_node = self.goto[node].get(char)
+            if next_node is None:
+                next_node = len(self.goto)
+                self.goto[node][char] = next_node
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append(None)
+            node = next_node
+        self.out[node] = word
+
+    def build(self):
+        """Compute failure links breadth-first."""
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                fail = self.goto[state].get(char, 0)
+                self.fail[child] = fail if fail != child else 0
+                if self.out[child] is None:
+                    self.out[child] = self.out[self.fail[child]]
+
+    def search(self, text):
+        """Return the first filtered word found in text, or None."""
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node] is not None:
+                return out[node]
+        return None
+
+
 class ChannelFilter:
     """Channelf filter"""
 
@@ -48,9 +111,24 @@ class ChannelFilter:
         """Init."""
         self.bot = bot
         self.settings = dataIO.load_json(JSON)
+        self.matchers = {}
+
+    def get_matcher(self, server_id, channel_id):
+        """Compiled matcher for a channel, None if nothing is filtered.
+
+        Cached per channel until the word list changes.
+        """
+        try:
+            return self.matchers[channel_id]
+        except KeyError:
+            words = self.settings.get(server_id, {}).get(channel_id)
+            matcher = WordMatcher(words.keys()) if words else None
+            self.matchers[channel_id] = matcher
+            return matcher
 
     def init_server_settings(self, server):
         self.settings[server.id] = {}
+        self.matchers.clear()
         dataIO.save_json(JSON, self.settings)
 
     def get_server_settings(self, server):
@@ -74,6 +152,7 @@ class ChannelFilter:
         channel_settings[word.lower()] = {
             'reason': reason
         }
+        self.matchers.pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
 
     def edit_word(self, server, channel, word, reason=None):
@@ -88,6 +167,7 @@ class ChannelFilter:
         """Remove word from filter."""
         channel_settings = self.get_channel_settings(server, channel)
         success = channel_settings.pop(word, None)
+        self.matchers.pop(channel.id, None)
         dataIO.save_json(JSON, self.settings)
         if success is None:
             return False
@@ -168,6 +248,45 @@ class ChannelFilter:
             return
         await self.bot.say(", ".join(out))
 
+    @checks.is_owner()
+    @channelfilter.command(name="benchmark", pass_context=True)
+    async def channelfilter_benchmark(self, ctx, words: int = 5000, messages: int = 1000):
+        """Compare filter engines with random words."""
+        await self.bot.type()
+
+        def random_word(k):
+            return ''.join(random.choice(string.ascii_lowercase) for _ in range(k))
+
+        word_list = [random_word(random.randint(4, 12)) for _ in range(words)]
+        texts = [
+            ' '.join(random_word(random.randint(2, 10)) for _ in range(20))
+            for _ in range(messages)
+        ]
+
+        start = time.perf_counter()
+        matcher = WordMatcher(word_list)
+        build_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for text in texts:
+            matcher.search(text)
+        automaton_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for text in texts:
+            for word in word_list:
+                if word.lower() in text.lower():
+                    break
+        loop_time = time.perf_counter() - start
+
+        out = [
+            "{} words, {} messages".format(words, messages),
+            "{:<10}: {:>10.2f} ms".format('build', build_time * 1000),
+            "{:<10}: {:>10.2f} µs / message".format('automaton', automaton_time / messages * 1e6),
+            "{:<10}: {:>10.2f} µs / message".format('loop', loop_time / messages * 1e6),
+        ]
+        await self.bot.say(box('\n'.join(out), lang='py'))
+
     async def on_message(self, message):
         """Filter words by channel."""
         if self == self.bot.get_cog("ChannelFilter"):
@@ -187,20 +306,21 @@ class ChannelFilter:
             if author.server_permissions.manage_server:
                 return
 
-            channel_settings = self.get_channel_settings(server, channel)
-            if not isinstance(channel_settings, dict):
+            matcher = self.get_matcher(server.id, channel.id)
+            if matcher is None:
                 return
 
-            for word in channel_settings.keys():
-                if word.lower() in message.content.lower():
-                    reason = channel_settings[word].get('reason', 'that')
-                    await self.bot.send_message(
-                        channel,
-                        "{} {}.".format(
-                            author.mention,
-                            reason
-                        ))
-                    await self.bot.delete_message(message)
+            word = matcher.search(message.content)
+            if word is not None:
+                channel_settings = self.get_channel_settings(server, channel)
+                reason = channel_settings[word].get('reason', 'that')
+                await self.bot.send_message(
+                    channel,
+                    "{} {}.".format(
+                        author.mention,
+                        reason
+                    ))
+                await self.bot.delete_message(message)
 
 
 def check_folder():
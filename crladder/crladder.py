@@ -22,21 +22,24 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 
+import asyncio
 import datetime as dt
 import itertools
 import math
 import os
+from collections import OrderedDict
 from random import choice
 
 import aiohttp
 import discord
+import numpy as np
 from box import Box
 from cogs.utils import checks
-from cogs.utils.chat_formatting import inline, box
+from cogs.utils.chat_formatting import inline, box, pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 from trueskill import Rating
-from trueskill import TrueSkill, rate_1vs1, quality_1vs1
+from trueskill import TrueSkill, rate_1vs1, calc_draw_margin, global_env
 
 PATH = os.path.join("data", "crladder")
 JSON = os.path.join(PATH, "settings.json")
@@ -52,6 +55,16 @@ BETA = SIGMA / 2
 TAU = BETA / 100
 DRAW_PROBABILITY = 0.01
 
+# ratings saved before every this many matches in a replay
+REPLAY_CHECKPOINT_INTERVAL = 256
+
+BATTLES_URL = 'http://api.royaleapi.com/player/{}?keys=battles'
+# seconds to keep a player's battle log
+BATTLELOG_TTL = 60
+# battle logs fetched at the same time in a series scan
+BATTLELOG_CONCURRENCY = 5
+VALID_BATTLE_TYPES = ['friendly', 'clanMate']
+
 env = TrueSkill(
     mu=MU,
     sigma=SIGMA,
@@ -93,6 +106,230 @@ def win_probability(rA: Rating, rB: Rating):
     return env.cdf(delta_mu / rsss)
 
 
+def env_cdf(x):
+    """Normal cdf of an array, as computed by env.cdf.
+
+    Uses the same erfc approximation as trueskill's default backend
+    so matrix entries equal win_probability.
+    """
+    z = np.abs(x) / math.sqrt(2)
+    t = 1. / (1. + z / 2.)
+    r = t * np.exp(-z * z - 1.26551223 + t * (1.00002368 + t * (
+        0.37409196 + t * (0.09678418 + t * (-0.18628806 + t * (
+            0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+                -0.82215223 + t * 0.17087277
+            )))
+        )))
+    )))
+    # erfc(-x / sqrt(2)) is 2 - r for x > 0
+    return 0.5 * np.where(x > 0, 2. - r, r)
+
+
+class RatingMatrix:
+    """Win probability and match quality of every pair of players in a series.
+
+    Computed from mu and sigma arrays. win_prob[i, j] is the chance player i
+    beats player j, using the same formula as win_probability. quality[i, j]
+    is TrueSkill 1vs1 match quality in env.
+    """
+
+    def __init__(self, players):
+        self.players = list(players)
+        self.row = {str(p['discord_id']): i for i, p in enumerate(self.players)}
+        mu = np.array([p['rating']['mu'] for p in self.players], dtype=float)
+        sigma = np.array([p['rating']['sigma'] for p in self.players], dtype=float)
+
+        delta_mu = mu[:, None] - mu[None, :]
+        sigma_sq = sigma[:, None] ** 2 + sigma[None, :] ** 2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            self.win_prob = env_cdf(delta_mu / np.sqrt(sigma_sq))
+        denom = 2 * env.beta ** 2 + sigma_sq
+        self.quality = np.sqrt(2 * env.beta ** 2 / denom) * np.exp(-delta_mu ** 2 / (2 * denom))
+        np.fill_diagonal(self.quality, 0)
+
+    def matchups(self, discord_id, limit=10):
+        """(opponent player, quality, win probability) best first."""
+        i = self.row[str(discord_id)]
+        order = [j for j in np.argsort(-self.quality[i], kind='stable') if j != i][:limit]
+        return [(self.players[j], float(self.quality[i, j]), float(self.win_prob[i, j])) for j in order]
+
+    def pairings(self, exclude=None):
+        """Pair players greedily by best match quality.
+
+        :param exclude: set of frozenset({discord_id, discord_id}) pairs to skip.
+        :return: list of (player, player, quality), player left over if odd.
+        """
+        exclude = exclude or set()
+        ids = [str(p['discord_id']) for p in self.players]
+        rows, cols = np.triu_indices(len(self.players), k=1)
+        order = np.argsort(-self.quality[rows, cols], kind='stable')
+        paired = set()
+        pairs = []
+        for i, j in zip(rows[order], cols[order]):
+            if i in paired or j in paired:
+                continue
+            if frozenset((ids[i], ids[j])) in exclude:
+                continue
+            paired.update((i, j))
+            pairs.append((self.players[i], self.players[j], float(self.quality[i, j])))
+        unpaired = [p for i, p in enumerate(self.players) if i not in paired]
+        return pairs, unpaired
+
+
+def rate_1vs1_fast(mu_w, sigma_w, mu_l, sigma_l, drawn=False, ts_env=None):
+    """Closed form of trueskill.rate_1vs1 on floats.
+
+    :return: (mu_w, sigma_w, mu_l, sigma_l) after the match.
+    """
+    if ts_env is None:
+        ts_env = global_env()
+    var_w = sigma_w ** 2 + ts_env.tau ** 2
+    var_l = sigma_l ** 2 + ts_env.tau ** 2
+    c_sq = 2 * ts_env.beta ** 2 + var_w + var_l
+    c = math.sqrt(c_sq)
+    margin = calc_draw_margin(ts_env.draw_probability, 2, ts_env) / c
+    t = (mu_w - mu_l) / c
+    if drawn:
+        v, w = ts_env.v_draw(t, margin), ts_env.w_draw(t, margin)
+    else:
+        v, w = ts_env.v_win(t, margin), ts_env.w_win(t, margin)
+    return (
+        mu_w + var_w / c * v, math.sqrt(var_w * (1 - var_w / c_sq * w)),
+        mu_l - var_l / c * v, math.sqrt(var_l * (1 - var_l / c_sq * w)),
+    )
+
+
+class RatingReplay:
+    """Rebuild ratings of a series from its matches in timestamp order.
+
+    Matches are kept as arrays of player indexes and outcomes. Ratings
+    are saved at checkpoints so a change only replays matches from the
+    last checkpoint before it. Rates with trueskill's global env, like
+    battle reports do.
+    """
+
+    def __init__(self, checkpoint_interval=REPLAY_CHECKPOINT_INTERVAL):
+        self.checkpoint_interval = checkpoint_interval
+        self.tags = []
+        self.tag_index = {}
+        self.keys = []
+        self.timestamps = np.zeros(0, dtype=np.int64)
+        self.player1 = np.zeros(0, dtype=np.int32)
+        self.player2 = np.zeros(0, dtype=np.int32)
+        # 1: player1 won, 0: draw, -1: player2 won
+        self.outcome = np.zeros(0, dtype=np.int8)
+        # match x player1/player2 x mu/sigma, after the match
+        self.history = np.zeros((0, 2, 2))
+        # match position -> (mu, sigma) before that match
+        self.checkpoints = {}
+        self.mu = np.zeros(0)
+        self.sigma = np.zeros(0)
+
+    def player(self, tag):
+        tag = normalize_tag(tag)
+        if tag not in self.tag_index:
+            self.tag_index[tag] = len(self.tags)
+            self.tags.append(tag)
+        return self.tag_index[tag]
+
+    def update(self, matches):
+        """Replay ratings for matches dict, from the first changed match.
+
+        :return: position of the first replayed match.
+        """
+        keys = sorted(matches.keys(), key=lambda k: int(k))
+        player1 = np.array([self.player(matches[k]['player1']['tag']) for k in keys], dtype=np.int32)
+        player2 = np.array([self.player(matches[k]['player2']['tag']) for k in keys], dtype=np.int32)
+        outcome = np.array([
+            np.sign(matches[k]['player1']['crowns'] - matches[k]['player2']['crowns']) for k in keys
+        ], dtype=np.int8)
+        timestamps = np.array([int(k) for k in keys], dtype=np.int64)
+
+        n = min(len(keys), len(self.keys))
+        same = (
+            (timestamps[:n] == self.timestamps[:n]) &
+            (player1[:n] == self.player1[:n]) &
+            (player2[:n] == self.player2[:n]) &
+            (outcome[:n] == self.outcome[:n])
+        )
+        changed = np.flatnonzero(~same)
+        start = int(changed[0]) if len(changed) else n
+
+        self.keys = keys
+        self.timestamps, self.player1, self.player2, self.outcome = timestamps, player1, player2, outcome
+        history = np.zeros((len(keys), 2, 2))
+        history[:start] = self.history[:start]
+        self.history = history
+        self.replay(start)
+        return start
+
+    def replay(self, start=0):
+        """Replay matches from position start."""
+        self.checkpoints = {k: v for k, v in self.checkpoints.items() if k <= start}
+        begin = max(self.checkpoints.keys(), default=None)
+        if begin is None:
+            begin = 0
+            mu = np.full(len(self.tags), float(MU))
+            sigma = np.full(len(self.tags), float(SIGMA))
+        else:
+            mu, sigma = self.checkpoints[begin]
+            # pad for players added after the checkpoint
+            mu = np.concatenate([mu, np.full(len(self.tags) - len(mu), float(MU))])
+            sigma = np.concatenate([sigma, np.full(len(self.tags) - len(sigma), float(SIGMA))])
+
+        ts_env = global_env()
+        player1, player2, outcome = self.player1.tolist(), self.player2.tolist(), self.outcome.tolist()
+        mu, sigma = mu.tolist(), sigma.tolist()
+        history = self.history
+        for k in range(begin, len(player1)):
+            if k % self.checkpoint_interval == 0:
+                self.checkpoints[k] = (np.array(mu), np.array(sigma))
+            i, j = player1[k], player2[k]
+            if outcome[k] < 0:
+                mu[j], sigma[j], mu[i], sigma[i] = rate_1vs1_fast(
+                    mu[j], sigma[j], mu[i], sigma[i], ts_env=ts_env)
+            else:
+                mu[i], sigma[i], mu[j], sigma[j] = rate_1vs1_fast(
+                    mu[i], sigma[i], mu[j], sigma[j], drawn=outcome[k] == 0, ts_env=ts_env)
+            history[k] = ((mu[i], sigma[i]), (mu[j], sigma[j]))
+
+        self.mu, self.sigma = np.array(mu), np.array(sigma)
+
+    def rating(self, tag):
+        """(mu, sigma) of a player after all matches."""
+        i = self.tag_index.get(normalize_tag(tag))
+        if i is None or i >= len(self.mu):
+            return float(MU), float(SIGMA)
+        return float(self.mu[i]), float(self.sigma[i])
+
+    def rating_history(self, tag):
+        """Timestamps, mu and sigma arrays of a player after each of their matches."""
+        i = self.tag_index.get(normalize_tag(tag))
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0), np.zeros(0)
+        as_player1 = self.player1 == i
+        rows = np.flatnonzero(as_player1 | (self.player2 == i))
+        side = np.where(as_player1[rows], 0, 1)
+        return self.timestamps[rows], self.history[rows, side, 0], self.history[rows, side, 1]
+
+    def apply(self, series):
+        """Write replayed ratings to players and matches of series."""
+        for player in series['players']:
+            mu, sigma = self.rating(player['tag'])
+            player['rating'] = {"mu": mu, "sigma": sigma}
+        prev = {}
+        for k, key in enumerate(self.keys):
+            match = series['matches'][key]
+            players = [self.player1[k], self.player2[k]]
+            for side, field in enumerate(['player1', 'player2']):
+                tag = self.tags[players[side]]
+                old = prev.get(tag, (float(MU), float(SIGMA)))
+                new = (float(self.history[k, side, 0]), float(self.history[k, side, 1]))
+                match[field]['old_rating'] = {"mu": old[0], "sigma": old[1]}
+                match[field]['new_rating'] = {"mu": new[0], "sigma": new[1]}
+                prev[tag] = new
+
+
 class LadderException(Exception):
     pass
 
@@ -127,6 +364,53 @@ class ClashRoyaleAPI:
         self.token = token
 
 
+class BattleLogClient:
+    """Fetch battle logs with one pooled session, cached by tag for BATTLELOG_TTL."""
+
+    def __init__(self, ttl=BATTLELOG_TTL):
+        self.ttl = ttl
+        self.session = None
+        # tag -> (expiry, battles), in expiry order
+        self.cache = OrderedDict()
+        self.pending = {}
+
+    async def battles(self, tag, auth):
+        """Raw battle dicts of a player."""
+        now = dt.datetime.utcnow().timestamp()
+        cached = self.cache.get(tag)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+        # share one request between concurrent callers
+        future = self.pending.get(tag)
+        if future is None:
+            future = asyncio.ensure_future(self.fetch(tag, auth))
+            self.pending[tag] = future
+        try:
+            battles = await asyncio.shield(future)
+        finally:
+            self.pending.pop(tag, None)
+        self.cache.pop(tag, None)
+        self.cache[tag] = (now + self.ttl, battles)
+        # drop expired logs so the cache only holds recent lookups
+        while next(iter(self.cache.values()))[0] <= now:
+            self.cache.popitem(last=False)
+        return battles
+
+    async def fetch(self, tag, auth):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession()
+        async with self.session.get(BATTLES_URL.format(tag), headers={'auth': auth}) as resp:
+            if resp.status != 200:
+                raise APIError(resp)
+            response = await resp.json()
+        return response.get('battles') or []
+
+    def close(self):
+        if self.session is not None:
+            loop = asyncio.get_event_loop()
+            loop.create_task(self.session.close())
+
+
 class Player:
     """Player in a game."""
 
@@ -190,6 +474,14 @@ class ServerSettings:
         return self._model
 
 
+def battle_opponent_tag(battle_dict):
+    """Opponent tag of a raw battle dict."""
+    try:
+        return normalize_tag(battle_dict['opponent'][0]['tag'])
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
 class Battle:
     def __init__(self, battle_dict):
         self.data = Box(battle_dict, default_box=True, camel_killer_box=True)
@@ -315,8 +607,48 @@ class Match:
         }
 
 
+class SeriesIndex:
+    """Lookups of a series: saved match timestamps and players by discord id and tag.
+
+    Holds references to the player dicts in the series so rating updates
+    are seen without rebuilding.
+    """
+
+    def __init__(self, series):
+        self.series = series
+        self.timestamps = set(series['matches'].keys())
+        self.players_by_id = {}
+        self.players_by_tag = {}
+        self._matrix = None
+        self.replay = RatingReplay()
+        for player in series['players']:
+            self.add_player(player)
+
+    def add_player(self, player):
+        self.players_by_id[str(player['discord_id'])] = player
+        self.players_by_tag[player['tag']] = player
+        self._matrix = None
+
+    def ratings_changed(self):
+        self._matrix = None
+
+    @property
+    def matrix(self) -> RatingMatrix:
+        """Rating matrix, cached until the next rating change."""
+        if self._matrix is None:
+            self._matrix = RatingMatrix(self.series['players'])
+        return self._matrix
+
+    def get_player(self, discord_id):
+        return self.players_by_id.get(str(discord_id))
+
+
 class Settings:
-    """CRLadder settings."""
+    """CRLadder settings.
+
+    Lookups do not write to disk. Methods that change settings save once
+    at the end; dataIO writes to a temp file and renames it.
+    """
     server_default = {
         "series": {}
     }
@@ -336,6 +668,18 @@ class Settings:
         if "servers" not in self.model:
             self.model["servers"] = {}
 
+        # id(series) -> SeriesIndex
+        self._indexes = {}
+        self.client = BattleLogClient()
+
+    def series_index(self, series) -> SeriesIndex:
+        """Index of a series, built on first use."""
+        index = self._indexes.get(id(series))
+        if index is None or index.series is not series:
+            index = SeriesIndex(series)
+            self._indexes[id(series)] = index
+        return index
+
     def save(self):
         """Save settings to file."""
         # preprocess rating if found
@@ -367,6 +711,7 @@ class Settings:
                 for player_id, player in series['players'].items():
                     player_list.append(player.copy())
                 series['players'] = player_list
+        self._indexes.clear()
         self.save()
 
     def server_model(self, server):
@@ -378,7 +723,7 @@ class Settings:
         """Create server settings if required."""
         if server.id not in self.model['servers']:
             self.model['servers'][server.id] = self.server_default
-        self.save()
+            self.save()
 
     def get_all_series(self, server):
         """Get all series."""
@@ -395,9 +740,8 @@ class Settings:
         names = []
         for series_name, series in self.server_model(server)["series"].items():
             if series.get('status') == 'active':
-                for player in series['players']:
-                    if str(player['discord_id']) == str(member.id):
-                        names.append(series_name)
+                if self.series_index(series).get_player(member.id) is not None:
+                    names.append(series_name)
         return names
 
     def get_series(self, server, name=None, member=None):
@@ -431,15 +775,8 @@ class Settings:
     def get_player(self, server, name, member: discord.Member):
         """Check player settings."""
         self.check_server(server)
-        try:
-            series = self.get_series(server, name=name)
-            for player in series['players']:
-                if player['discord_id'] == member.id:
-                    return player
-        except NoSuchSeries:
-            raise NoSuchSeries
-        else:
-            return None
+        series = self.get_series(server, name=name)
+        return self.series_index(series).get_player(member.id)
 
     def init_server(self, server):
         """Initialize server settings to default"""
@@ -463,6 +800,7 @@ class Settings:
         else:
             all_series = self.get_all_series(server)
             all_series.pop(name)
+            self._indexes.pop(id(series), None)
             self.save()
 
     def add_player(self, server, name, player: discord.Member, player_tag=None):
@@ -473,16 +811,21 @@ class Settings:
             return False
         else:
             series["players"].append(Player(discord_id=player.id, tag=player_tag).to_dict())
+            # list converts the dict on append: index the stored item
+            self.series_index(series).add_player(series["players"][-1])
             self.save()
             return True
 
     def get_player_tag(self, server, player: discord.Member):
         """Search crprofile cog for Clash Royale player tag."""
-        cps = Box(
-            dataIO.load_json(os.path.join("data", "crprofile", "settings.json")),
-            default_box=True, default_box_attr=None)
-        cps_players = cps.servers[server.id].players
-        player_tag = cps_players.get(player.id)
+        crprofile = self.bot.get_cog("CRProfile")
+        if crprofile is not None:
+            player_tag = crprofile.tag_registry.member_tag(server.id, player.id)
+        else:
+            cps = Box(
+                dataIO.load_json(os.path.join("data", "crprofile", "settings.json")),
+                default_box=True, default_box_attr=None)
+            player_tag = cps.servers[server.id].players.get(player.id)
         if player_tag is None:
             raise CannotFindPlayer
         else:
@@ -490,49 +833,77 @@ class Settings:
 
     def verify_player(self, series, member: discord.Member):
         """Verify player is in series."""
-        for player in series['players']:
-            if player['discord_id'] == member.id:
-                return True
-        return False
+        return self.series_index(series).get_player(member.id) is not None
 
     async def find_battles(self, series, member1: discord.Member, member2: discord.Member):
         """Find battle by member1 vs member2."""
-        player1, player2 = None, None
-        for player in series['players']:
-            if player['discord_id'] == member1.id:
-                player1 = player
-            if player['discord_id'] == member2.id:
-                player2 = player
-
-        url = 'http://api.royaleapi.com/player/{}?keys=battles'.format(player1['tag'])
-        response = {}
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers={'auth': self.auth}) as resp:
-                if resp.status != 200:
-                    raise APIError(resp)
-                else:
-                    response = await resp.json()
-
-        all_battles = response.get('battles')
-        battles = []
-        for battle in all_battles:
-            b = Battle(battle)
-            add_this = True
-            if not b.valid_type:
-                add_this = False
-            if b.opponent_tag != player2['tag']:
-                add_this = False
-            if add_this:
-                battles.append(b)
+        index = self.series_index(series)
+        player1 = index.get_player(member1.id)
+        player2 = index.get_player(member2.id)
 
-        return battles
+        all_battles = await self.client.battles(player1['tag'], self.auth)
+        # filter raw dicts: Box conversion is only done for matches
+        return [
+            Battle(battle) for battle in all_battles
+            if battle.get('type') in VALID_BATTLE_TYPES and battle_opponent_tag(battle) == player2['tag']
+        ]
+
+    async def find_series_battles(self, series):
+        """Find unsaved battles between any two players of a series.
+
+        Each player's battle log is fetched once. A battle appears in the
+        logs of both players; it is returned once, from the log fetched
+        first.
+
+        :return: (battles sorted by time, tags that could not be fetched)
+        """
+        index = self.series_index(series)
+        tags = list(index.players_by_tag.keys())
+        semaphore = asyncio.Semaphore(BATTLELOG_CONCURRENCY)
+
+        async def fetch(tag):
+            async with semaphore:
+                try:
+                    return await self.client.battles(tag, self.auth)
+                except (APIError, aiohttp.ClientError):
+                    return None
+
+        logs = await asyncio.gather(*[fetch(tag) for tag in tags])
+
+        battles = {}
+        failed = []
+        for tag, log in zip(tags, logs):
+            if log is None:
+                failed.append(tag)
+                continue
+            for battle in log:
+                timestamp = str(battle.get('utcTime'))
+                if timestamp in battles or timestamp in index.timestamps:
+                    continue
+                if battle.get('type') not in VALID_BATTLE_TYPES:
+                    continue
+                opponent = battle_opponent_tag(battle)
+                if opponent == tag or opponent not in index.players_by_tag:
+                    continue
+                battles[timestamp] = Battle(battle)
+        return sorted(battles.values(), key=lambda b: int(b.timestamp)), failed
+
+    def save_series_battles(self, series, battles):
+        """Save battles and replay ratings in one write."""
+        index = self.series_index(series)
+        for battle in battles:
+            player1 = Player.from_dict(index.players_by_tag[normalize_tag(battle.team_tag)])
+            player2 = Player.from_dict(index.players_by_tag[normalize_tag(battle.opponent_tag)])
+            # ratings of the match are set by the replay
+            self.save_battle(
+                player1=player1, player2=player2, player1_old_rating=player1.rating,
+                player2_old_rating=player2.rating, series=series, battle=battle
+            )
+        self.replay_series(series)
 
     def is_battle_saved(self, server, name, battle: Battle):
-        self.save()
         series = self.get_series(server, name=name)
-        keys = [k for k in series['matches'].keys()]
-        is_in = str(battle.timestamp) in keys
-        return is_in
+        return str(battle.timestamp) in self.series_index(series).timestamps
 
     def save_battle(self,
                     player1: Player = None,
@@ -540,25 +911,65 @@ class Settings:
                     player1_old_rating: Rating = None,
                     player2_old_rating: Rating = None,
                     series=None, battle=None):
+        """Add match to series. Does not save."""
         match = Match(player1=player1, player2=player2, player1_old_rating=player1_old_rating,
                       player2_old_rating=player2_old_rating, battle=battle)
 
         series['matches'][str(battle.timestamp)] = match.to_dict()
-        self.save()
+        self.series_index(series).timestamps.add(str(battle.timestamp))
 
-    def update_player_rating(self, server, name, player):
-        series = self.get_series(server, name=name)
-        update_player = None
-        for p in series['players']:
-            if p['tag'] == player.tag:
-                update_player = p
+    def update_player_rating(self, series, player):
+        """Set rating of player in series. Does not save."""
+        index = self.series_index(series)
+        update_player = index.players_by_tag.get(player.tag)
         if update_player is None:
             return False
         update_player['rating'] = {
             "mu": float(player.rating.mu),
             "sigma": float(player.rating.sigma)
         }
+        index.ratings_changed()
+        return True
+
+    def report_battle(self, series, player1: Player, player2: Player,
+                      player1_old_rating: Rating, player2_old_rating: Rating, battle: Battle):
+        """Save match and new ratings of both players in one write.
+
+        A battle older than the last saved match changes the ratings of
+        everything after it, so the series is replayed instead.
+        """
+        index = self.series_index(series)
+        late = any(int(k) > int(battle.timestamp) for k in index.timestamps)
+        self.save_battle(
+            player1=player1, player2=player2, player1_old_rating=player1_old_rating,
+            player2_old_rating=player2_old_rating, series=series, battle=battle
+        )
+        if late:
+            self.replay_series(series, save=False)
+        else:
+            self.update_player_rating(series, player1)
+            self.update_player_rating(series, player2)
         self.save()
+        return late
+
+    def replay_series(self, series, save=True):
+        """Recompute all ratings of series from its matches."""
+        index = self.series_index(series)
+        start = index.replay.update(series['matches'])
+        index.replay.apply(series)
+        index.ratings_changed()
+        if save:
+            self.save()
+        return start
+
+    def remove_match(self, series, timestamp):
+        """Remove a match and replay ratings. Return False if not found."""
+        key = str(timestamp)
+        if key not in series['matches']:
+            return False
+        series['matches'].pop(key)
+        self.series_index(series).timestamps.discard(key)
+        self.replay_series(series)
         return True
 
 
@@ -577,6 +988,9 @@ class CRLadder:
         self.bot = bot
         self.settings = Settings(bot)
 
+    def __unload(self):
+        self.settings.client.close()
+
     @commands.group(pass_context=True)
     async def crladderset(self, ctx):
         """Set crladder settings."""
@@ -684,6 +1098,72 @@ class CRLadder:
         else:
             await self.bot.say("Successfully added players.")
 
+    @checks.mod_or_permissions()
+    @crladderset.command(name="replay", pass_context=True)
+    async def crladderset_replay(self, ctx, name):
+        """Recompute all ratings of a series from its matches."""
+        server = ctx.message.server
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("Cannot find a series named {}".format(name))
+            return
+        self.settings.replay_series(series)
+        await self.bot.say("Replayed {} matches in {}.".format(len(series['matches']), name))
+
+    @checks.mod_or_permissions()
+    @crladderset.command(name="scan", pass_context=True)
+    async def crladderset_scan(self, ctx, name):
+        """Find and save all unreported battles between players of a series."""
+        server = ctx.message.server
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("Cannot find a series named {}".format(name))
+            return
+        await self.bot.type()
+
+        battles, failed = await self.settings.find_series_battles(series)
+        if failed:
+            await self.bot.say("Cannot fetch battles of: {}".format(', '.join('#' + tag for tag in failed)))
+        if not battles:
+            await self.bot.say("No new battles found.")
+            return
+
+        self.settings.save_series_battles(series, battles)
+
+        index = self.settings.series_index(series)
+
+        def player_name(tag):
+            player = index.players_by_tag[normalize_tag(tag)]
+            member = server.get_member(str(player['discord_id']))
+            return str(member) if member is not None else tag
+
+        o = ["Saved {} battles:".format(len(battles))]
+        for battle in battles:
+            o.append("{} {} {}-{} {}".format(
+                battle.timestamp_dt.strftime('%Y-%m-%d %H:%M'),
+                player_name(battle.team_tag),
+                battle.team_crowns, battle.opponent_crowns,
+                player_name(battle.opponent_tag)))
+        for page in pagify('\n'.join(o)):
+            await self.bot.say(box(page, lang='py'))
+
+    @checks.mod_or_permissions()
+    @crladderset.command(name="removematch", pass_context=True)
+    async def crladderset_removematch(self, ctx, name, timestamp):
+        """Remove a match by timestamp and recompute ratings."""
+        server = ctx.message.server
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("Cannot find a series named {}".format(name))
+            return
+        if self.settings.remove_match(series, timestamp):
+            await self.bot.say("Match removed. Ratings replayed.")
+        else:
+            await self.bot.say("Cannot find a match with that timestamp.")
+
     @commands.group(pass_context=True)
     async def crladder(self, ctx):
         """CRLadder anking system using TrueSkills."""
@@ -982,13 +1462,13 @@ class CRLadder:
 
                 # save battle
                 if save_battle:
-                    self.settings.save_battle(
-                        player1=p_author, player2=p_member, player1_old_rating=p_author_rating_old,
-                        player2_old_rating=p_member_rating_old, series=series, battle=battle
+                    late = self.settings.report_battle(
+                        series, p_author, p_member, p_author_rating_old, p_member_rating_old, battle
                     )
-                    updated = self.settings.update_player_rating(server, name, p_author)
-                    updated = self.settings.update_player_rating(server, name, p_member)
-                    await self.bot.say("Elo updated.")
+                    if late:
+                        await self.bot.say("Battle is older than saved matches. Elo replayed for the series.")
+                    else:
+                        await self.bot.say("Elo updated.")
 
     @crladder.command(name="winprob", aliases=['w'], pass_context=True)
     async def crladder_winprob(self, ctx, name, member1: discord.Member, member2: discord.Member = None):
@@ -1005,13 +1485,9 @@ class CRLadder:
             series = self.settings.get_series_by_name(server, name)
             if series is None:
                 raise NoSuchSeries
-            p1 = None
-            p2 = None
-            for player in series['players']:
-                if str(player['discord_id']) == pm1.id:
-                    p1 = player
-                if str(player['discord_id']) == pm2.id:
-                    p2 = player
+            index = self.settings.series_index(series)
+            p1 = index.get_player(pm1.id)
+            p2 = index.get_player(pm2.id)
             if p1 is None:
                 raise NoSuchPlayer
             if p2 is None:
@@ -1049,13 +1525,9 @@ class CRLadder:
             series = self.settings.get_series_by_name(server, name)
             if series is None:
                 raise NoSuchSeries
-            p1 = None
-            p2 = None
-            for player in series['players']:
-                if str(player['discord_id']) == pm1.id:
-                    p1 = player
-                if str(player['discord_id']) == pm2.id:
-                    p2 = player
+            index = self.settings.series_index(series)
+            p1 = index.get_player(pm1.id)
+            p2 = index.get_player(pm2.id)
             if p1 is None:
                 raise NoSuchPlayer
             if p2 is None:
@@ -1070,10 +1542,106 @@ class CRLadder:
             await self.bot.say(
                 "If {} plays against {}, "
                 "there is a {:.1%} chance to draw.".format(
-                    pm1, pm2, quality_1vs1(p1_rating, p2_rating)
+                    pm1, pm2, env.quality_1vs1(p1_rating, p2_rating)
                 )
             )
 
+    @crladder.command(name="history", aliases=['h'], pass_context=True)
+    async def crladder_history(self, ctx, name, member: discord.Member = None, limit=20):
+        """Rating history of a player."""
+        server = ctx.message.server
+        if member is None:
+            member = ctx.message.author
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+        index = self.settings.series_index(series)
+        player = index.get_player(member.id)
+        if player is None:
+            await self.bot.say("Player not found.")
+            return
+
+        index.replay.update(series['matches'])
+        timestamps, mu, sigma = index.replay.rating_history(player['tag'])
+        if not len(timestamps):
+            await self.bot.say("No matches found.")
+            return
+        o = ["Rating history of {} in series {}:".format(member, name)]
+        for t, m, s in list(zip(timestamps, mu, sigma))[-limit:]:
+            o.append("{}  {:>7.1f} ±{:>5.1f}".format(
+                dt.datetime.utcfromtimestamp(int(t)).strftime('%Y-%m-%d %H:%M'), m, s))
+        await self.bot.say(box('\n'.join(o), lang='py'))
+
+    @crladder.command(name="matchups", aliases=['m'], pass_context=True)
+    async def crladder_matchups(self, ctx, name, member: discord.Member = None):
+        """Best matchups by match quality."""
+        server = ctx.message.server
+        if member is None:
+            member = ctx.message.author
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+        if not self.settings.verify_player(series, member):
+            await self.bot.say("Player not found.")
+            return
+
+        matrix = self.settings.series_index(series).matrix
+        o = ["Best matchups for {} in series {}:".format(member, name)]
+        o.append("{:>7} {:>7}  {}".format("Quality", "Win", "Opponent"))
+        for player, quality, win_prob in matrix.matchups(member.id):
+            opponent = server.get_member(str(player['discord_id']))
+            o.append("{:>7.1%} {:>7.1%}  {}".format(
+                quality, win_prob, opponent if opponent is not None else player['tag']))
+        await self.bot.say(box('\n'.join(o), lang='py'))
+
+    @crladder.command(name="pairings", aliases=['p'], pass_context=True)
+    async def crladder_pairings(self, ctx, name, rounds=1):
+        """Suggest pairings with the best match quality.
+
+        Each round pairs players who have not played each other or been
+        paired in an earlier round.
+        """
+        server = ctx.message.server
+        try:
+            series = self.settings.get_series_by_name(server, name)
+        except NoSuchSeries:
+            await self.bot.say("No series with that name on this server.")
+            return
+
+        index = self.settings.series_index(series)
+        tag_ids = {tag: str(p['discord_id']) for tag, p in index.players_by_tag.items()}
+        played = set()
+        for match in series['matches'].values():
+            played.add(frozenset((
+                tag_ids.get(match['player1']['tag']),
+                tag_ids.get(match['player2']['tag']))))
+
+        def player_name(player):
+            member = server.get_member(str(player['discord_id']))
+            return str(member) if member is not None else player['tag']
+
+        o = []
+        for round_number in range(1, max(1, min(rounds, 10)) + 1):
+            pairs, unpaired = index.matrix.pairings(exclude=played)
+            if not pairs:
+                break
+            o.append("Round {}".format(round_number))
+            for p1, p2, quality in pairs:
+                played.add(frozenset((str(p1['discord_id']), str(p2['discord_id']))))
+                o.append("{:>6.1%}  {} vs {}".format(quality, player_name(p1), player_name(p2)))
+            if unpaired:
+                o.append("Unpaired: {}".format(', '.join(player_name(p) for p in unpaired)))
+
+        if not o:
+            await self.bot.say("No pairings left to suggest.")
+            return
+        for page in pagify('\n'.join(o)):
+            await self.bot.say(box(page, lang='py'))
+
 
 def check_folder():
     """Check folder."""
@@ -25,6 +25,7 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import asyncio
+import copy
 import datetime as dt
 import itertools
 import json
@@ -58,6 +59,8 @@ API_FETCH_TIMEOUT = 10
 
 BOTCOMMANDER_ROLES = ["Bot Commander"]
 
+SAVE_DELAY = 5
+
 CREDITS = 'Selfish + SML'
 
 CARDS = None
@@ -973,6 +976,98 @@ class CRPlayerModel:
         }
 
 
+class TagRegistry:
+    """Player tags of Discord members, indexed both ways by server.
+
+    Other cogs query this through CRProfile.tag_registry instead of
+    reading settings.json. Listeners are called as
+    listener(server_id, member_id, old_tag, new_tag) after every change;
+    a tag is None when it is not set.
+    """
+
+    def __init__(self):
+        """Init."""
+        # server_id -> member_id -> tag, the players dicts of the settings
+        self._tags = {}
+        # server_id -> tag -> set of member_id
+        self._members = {}
+        self._listeners = []
+
+    def load(self, server_id, players):
+        """Index players (member_id -> tag) of a server.
+
+        The dict is used as is so that changes made through the registry
+        are also in the settings it belongs to.
+        """
+        old = dict(self._tags.get(server_id, {}))
+        members = defaultdict(set)
+        for member_id, tag in players.items():
+            members[tag].add(member_id)
+        self._tags[server_id] = players
+        self._members[server_id] = members
+        for member_id in set(old) | set(players):
+            if old.get(member_id) != players.get(member_id):
+                self._notify(server_id, member_id, old.get(member_id), players.get(member_id))
+
+    def member_tag(self, server_id, member_id):
+        """Player tag of member, or None."""
+        return self._tags.get(server_id, {}).get(member_id)
+
+    def tag_member_ids(self, server_id, tag):
+        """Set of member ids associated with player tag."""
+        members = self._members.get(server_id)
+        if members is None:
+            return set()
+        return set(members.get(tag, ()))
+
+    def set_tag(self, server_id, member_id, tag):
+        """Associate player tag with member."""
+        players = self._tags.setdefault(server_id, {})
+        old_tag = players.get(member_id)
+        if old_tag == tag:
+            return
+        if old_tag is not None:
+            self._unindex(server_id, member_id, old_tag)
+        players[member_id] = tag
+        self._members.setdefault(server_id, defaultdict(set))[tag].add(member_id)
+        self._notify(server_id, member_id, old_tag, tag)
+
+    def remove_member(self, server_id, member_id):
+        """Remove player tag of member. Return removed tag."""
+        tag = self._tags.get(server_id, {}).pop(member_id, None)
+        if tag is not None:
+            self._unindex(server_id, member_id, tag)
+            self._notify(server_id, member_id, tag, None)
+        return tag
+
+    def remove_tag(self, server_id, tag):
+        """Remove player tag from all members. Return their ids."""
+        member_ids = self.tag_member_ids(server_id, tag)
+        for member_id in member_ids:
+            self.remove_member(server_id, member_id)
+        return member_ids
+
+    def _unindex(self, server_id, member_id, tag):
+        members = self._members[server_id]
+        members[tag].discard(member_id)
+        if not members[tag]:
+            del members[tag]
+
+    def add_listener(self, listener):
+        """Call listener on tag changes."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        """Stop calling listener on tag changes."""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _notify(self, server_id, member_id, old_tag, new_tag):
+        for listener in list(self._listeners):
+            listener(server_id, member_id, old_tag, new_tag)
+
+
 class Settings:
     """Cog settings.
 
@@ -989,39 +1084,62 @@ class Settings:
         "players": {}
     }
 
-    def __init__(self, bot, filepath, session=None):
+    def __init__(self, bot, filepath, session=None, save_delay=SAVE_DELAY):
         """Init."""
         self.bot = bot
         self.filepath = filepath
+        self.save_delay = save_delay
+        self._save_handle = None
         self.settings = nested_dict()
         self.settings.update(dataIO.load_json(filepath))
         self.session = session
+        self.registry = TagRegistry()
+        for server_id, server_settings in self.settings["servers"].items():
+            self.registry.load(server_id, server_settings.setdefault("players", {}))
 
     def init_server(self, server):
         """Initialized server settings.
 
         This will wipe all clan data and player data.
         """
-        self.settings["servers"][server.id] = self.SERVER_DEFAULTS
+        self.settings["servers"][server.id] = copy.deepcopy(self.SERVER_DEFAULTS)
+        self.registry.load(server.id, self.settings["servers"][server.id]["players"])
         self.save()
 
     def init_players(self, server):
         """Initialized clan settings."""
         self.settings["servers"][server.id]["players"] = {}
+        self.registry.load(server.id, self.settings["servers"][server.id]["players"])
         self.save()
 
     def check_server(self, server):
         """Make sure server exists in settings."""
         if server.id not in self.settings["servers"]:
-            self.settings["servers"][server.id] = self.SERVER_DEFAULTS
-        self.save()
+            self.settings["servers"][server.id] = copy.deepcopy(self.SERVER_DEFAULTS)
+            self.registry.load(server.id, self.settings["servers"][server.id]["players"])
+            self.save()
 
     def get_players(self, server):
         """CR Players settings by server."""
         return self.settings["servers"][server.id]["players"]
 
     def save(self):
-        """Save data to disk."""
+        """Save data to disk after save_delay.
+
+        Changes made in the meantime are written with it.
+        """
+        if self._save_handle is None:
+            loop = asyncio.get_event_loop()
+            self._save_handle = loop.call_later(self.save_delay, self.save_now)
+
+    def save_now(self):
+        """Save data to disk.
+
+        dataIO writes to a temp file first, so the file is never partial.
+        """
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
         dataIO.save_json(self.filepath, self.settings)
 
     def set_player(self, server, member, tag):
@@ -1031,44 +1149,29 @@ class Settings:
         """
         self.check_server(server)
         tag = SCTag(tag).tag
-        if "players" not in self.settings["servers"][server.id]:
-            self.settings["servers"][server.id]["players"] = {}
-        players = self.settings["servers"][server.id]["players"]
-        players[member.id] = tag
-        self.settings["servers"][server.id]["players"] = players
+        self.registry.set_tag(server.id, member.id, tag)
         self.save()
 
     def rm_player_tag(self, server, member=None, tag=None):
         """Remove player tag from settings."""
         self.check_server(server)
         if member is not None:
-            try:
-                self.settings["servers"][server.id]["players"].pop(member.id, None)
-            except KeyError:
-                pass
-            self.save()
+            if self.registry.remove_member(server.id, member.id) is not None:
+                self.save()
         if tag is not None:
-            try:
-                players = self.settings["servers"][server.id]["players"].copy()
-                for member_id, player_tag in players.items():
-                    if player_tag == tag:
-                        self.settings["servers"][server.id]["players"].pop(member_id, None)
-            except KeyError:
-                pass
-            self.save()
+            self.rm_tag(server, tag)
 
     def rm_tag(self, server, tag):
         """Remove player tag from settings by tag"""
+        if self.registry.remove_tag(server.id, SCTag(tag).tag):
+            self.save()
 
     def tag2member(self, server, tag):
         """Return Discord member from player tag."""
-        try:
-            players = self.settings["servers"][server.id]["players"]
-            for member_id, player_tag in players.items():
-                if player_tag == tag:
-                    return server.get_member(member_id)
-        except KeyError:
-            pass
+        for member_id in sorted(self.registry.tag_member_ids(server.id, tag)):
+            member = server.get_member(member_id)
+            if member is not None:
+                return member
         return None
 
     def server_settings(self, server):
@@ -1163,13 +1266,9 @@ class Settings:
     async def member2tag(self, server, member):
         """Return player tag from member."""
         # first try to get from settings
-        try:
-            players = self.settings["servers"][server.id]["players"]
-            for member_id, player_tag in players.items():
-                if member_id == member.id:
-                    return player_tag
-        except KeyError:
-            pass
+        player_tag = self.registry.member_tag(server.id, member.id)
+        if player_tag is not None:
+            return player_tag
 
         # if verified url is set, try to get from server
         if self.verify_url:
@@ -1312,7 +1411,13 @@ class CRProfile:
         self.session = aiohttp.ClientSession()
         self.model = Settings(bot, JSON, session=self.session)
 
+    @property
+    def tag_registry(self):
+        """Player tags of members, for use by other cogs."""
+        return self.model.registry
+
     def __unload(self):
+        self.model.save_now()
         if self.session:
             loop = asyncio.get_event_loop()
             loop.run_until_complete(
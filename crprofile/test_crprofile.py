@@ -0,0 +1,87 @@
+"""Tests for the crprofile tag registry.
+
+Run inside the bot environment: pytest crprofile/test_crprofile.py
+"""
+
+import importlib.util
+import os
+import shutil
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("cogs.utils.dataIO")
+pytest.importorskip("inflect")
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture
+def crprofile(tmpdir, monkeypatch):
+    """crprofile module, loaded from a bot-like working directory."""
+    data = tmpdir.mkdir("data").mkdir("crprofile")
+    shutil.copy(os.path.join(HERE, "data", "chests.json"), str(data))
+    monkeypatch.chdir(str(tmpdir))
+    spec = importlib.util.spec_from_file_location("crprofile", os.path.join(HERE, "crprofile.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def registry(crprofile):
+    registry = crprofile.TagRegistry()
+    registry.load("server", {"a": "AAA", "b": "AAA"})
+    return registry
+
+
+@pytest.fixture
+def changes(registry):
+    changes = []
+    registry.add_listener(lambda *change: changes.append(change))
+    return changes
+
+
+def test_lookups(registry):
+    assert registry.member_tag("server", "a") == "AAA"
+    assert registry.member_tag("server", "c") is None
+    assert registry.tag_member_ids("server", "AAA") == {"a", "b"}
+    assert registry.tag_member_ids("other", "AAA") == set()
+
+
+def test_listener_on_set(registry, changes):
+    registry.set_tag("server", "a", "CCC")
+    registry.set_tag("server", "a", "CCC")
+    registry.set_tag("server", "c", "DDD")
+    assert changes == [
+        ("server", "a", "AAA", "CCC"),
+        ("server", "c", None, "DDD"),
+    ]
+    assert registry.tag_member_ids("server", "AAA") == {"b"}
+
+
+def test_listener_on_remove(registry, changes):
+    assert registry.remove_member("server", "a") == "AAA"
+    assert registry.remove_member("server", "a") is None
+    assert registry.remove_tag("server", "AAA") == {"b"}
+    assert changes == [
+        ("server", "a", "AAA", None),
+        ("server", "b", "AAA", None),
+    ]
+    assert registry.tag_member_ids("server", "AAA") == set()
+
+
+def test_listener_on_reload(registry, changes):
+    registry.load("server", {"a": "AAA", "c": "CCC"})
+    assert sorted(changes) == [
+        ("server", "b", "AAA", None),
+        ("server", "c", None, "CCC"),
+    ]
+    assert registry.tag_member_ids("server", "AAA") == {"a"}
+
+
+def test_remove_listener(registry, changes):
+    listener = registry._listeners[0]
+    registry.remove_listener(listener)
+    registry.set_tag("server", "a", "CCC")
+    assert changes == []
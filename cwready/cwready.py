@@ -174,12 +174,21 @@ class CWReady:
 
         tag = None
 
+        # try to get tag from crprofile
+        crprofile = self.bot.get_cog("CRProfile")
+        if crprofile is not None:
+            tag = crprofile.tag_registry.member_tag(ctx.message.server.id, member.id)
+
         # if tag is none, attempt to load from racf_audit
-        db = os.path.join("data", "racf_audit", "player_db.json")
-        players = dataIO.load_json(db)
-        for k, v in players.items():
-            if v.get('user_id') == member.id:
-                tag = v.get('tag')
+        if tag is None:
+            racfaudit = self.bot.get_cog("RACFAudit")
+            if racfaudit is not None:
+                players = racfaudit.players
+            else:
+                players = dataIO.load_json(os.path.join("data", "racf_audit", "player_db.json"))
+            for k, v in players.items():
+                if v.get('user_id') == member.id:
+                    tag = v.get('tag')
 
         # try to get tag from verification URL
         verify_url = self.settings.get('verify_url')
@@ -24,12 +24,20 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
 # force update cards json v3
+import asyncio
 import datetime
 import datetime as dt
+import hashlib
 import io
 import os
+import random
 import re
+import sqlite3
 import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from concurrent.futures import ThreadPoolExecutor
 
 import aiohttp
@@ -39,19 +47,40 @@ from PIL import Image
 from PIL import ImageDraw
 from PIL import ImageFont
 from cogs.utils import checks
+from cogs.utils.chat_formatting import box
 from cogs.utils.chat_formatting import pagify
 from cogs.utils.dataIO import dataIO
 from discord.ext import commands
 
 SETTINGS_PATH = os.path.join("data", "deck", "settings.json")
+DECKS_DB_PATH = os.path.join("data", "deck", "decks.db")
 AKA_PATH = os.path.join("data", "deck", "cards_aka.yaml")
 CARDS_JSON_PATH = os.path.join("data", "deck", "cards.json")
 max_deck_per_user = 5
 
 PAGINATION_TIMEOUT = 20.0
+DECKS_PER_PAGE = 3
 HELP_URL = "https://github.com/smlbiobot/SML-Cogs/wiki/Deck#usage"
 CARDS_JSON_URL = "https://royaleapi.github.io/cr-api-data/json/cards.json"
 
+# Bump when get_deck_image output changes to invalidate cached renders
+DECK_IMAGE_VERSION = 1
+RENDER_CACHE_PATH = os.path.join("data", "deck", "cache")
+RENDER_CACHE_URLS_PATH = os.path.join(RENDER_CACHE_PATH, "urls.json")
+RENDER_CACHE_MEMORY_SIZE = 256
+RENDER_CACHE_DISK_SIZE = 200 * 1024 * 1024
+RENDER_CACHE_URLS_SIZE = 10000
+# attachment URLs stop working after a while, so upload again after this
+RENDER_CACHE_URL_TTL = 12 * 60 * 60
+RENDER_WORKERS = 2
+
+# Cheap substring checks before running any regex on a message
+DECKLINK_HINTS = ('clashroyale.com/deck', 'royaleapi.com/decks/stats')
+CRLINK_RE = re.compile(r'(http|ftp|https)://link.clashroyale.com/deck/..\?deck=([\d\;]+)')
+CRLINK_ID_RE = re.compile(r'2\d{7}')
+RAPILINK_RE = re.compile(r'(https|http)://royaleapi.com/decks/stats/([a-z,-]+)/?')
+RAPILINK_SECTION_RE = re.compile(r'(https|http)://royaleapi.com/decks/stats/([a-z,-]+)/.+')
+
 
 numbs = {
     "next": "➡",
@@ -74,6 +103,529 @@ class BotEmoji:
         return ''
 
 
+def deck_author_name(deck_author):
+    """Author name as rendered on deck images."""
+    if not deck_author:
+        return ""
+    if isinstance(deck_author, str):
+        return deck_author
+    if hasattr(deck_author, "name"):
+        return deck_author.name
+    return ""
+
+
+class DeckImageCache:
+    """Cache of rendered deck PNGs.
+
+    Keyed by (card keys, deck name, author name, image version).
+    Encoded PNGs are kept in a memory LRU backed by a size-capped disk
+    tier. Attachment URLs of images uploaded to the image server are
+    also remembered for RENDER_CACHE_URL_TTL so the same deck does not
+    need to be uploaded again.
+
+    Used from executor threads: state is guarded by a lock.
+    """
+
+    def __init__(self, path=RENDER_CACHE_PATH, memory_size=RENDER_CACHE_MEMORY_SIZE,
+                 disk_size=RENDER_CACHE_DISK_SIZE):
+        self.path = path
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.memory = OrderedDict()
+        self.lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        self.disk_usage = sum(
+            os.path.getsize(os.path.join(self.path, f))
+            for f in os.listdir(self.path) if f.endswith('.png')
+        )
+        # key -> [url, expiry timestamp]
+        self.urls = OrderedDict()
+        if dataIO.is_valid_json(RENDER_CACHE_URLS_PATH):
+            self.urls.update(
+                (key, value) for key, value in dataIO.load_json(RENDER_CACHE_URLS_PATH).items()
+                if isinstance(value, list))
+
+    @staticmethod
+    def key(card_keys, deck_name, deck_author):
+        s = "{}|{}|{}|{}".format(
+            ','.join(card_keys), deck_name or "Deck", deck_author_name(deck_author), DECK_IMAGE_VERSION)
+        return hashlib.sha1(s.encode('utf-8')).hexdigest()
+
+    def file_path(self, key):
+        return os.path.join(self.path, "{}.png".format(key))
+
+    def get_memory(self, key):
+        with self.lock:
+            png = self.memory.get(key)
+            if png is not None:
+                self.memory.move_to_end(key)
+        return png
+
+    def set_memory(self, key, png):
+        with self.lock:
+            self.memory[key] = png
+            self.memory.move_to_end(key)
+            while len(self.memory) > self.memory_size:
+                self.memory.popitem(last=False)
+
+    def get(self, key):
+        """PNG bytes from memory or disk, None if not cached. Blocking."""
+        png = self.get_memory(key)
+        if png is None:
+            try:
+                with open(self.file_path(key), 'rb') as f:
+                    png = f.read()
+            except FileNotFoundError:
+                return None
+            try:
+                os.utime(self.file_path(key))
+            except OSError:
+                pass
+            self.set_memory(key, png)
+        return png
+
+    def set(self, key, png):
+        """Store PNG bytes in memory and disk. Blocking."""
+        self.set_memory(key, png)
+        with self.lock:
+            try:
+                old_size = os.path.getsize(self.file_path(key))
+            except OSError:
+                old_size = 0
+            # readers may open the file without the lock: replace it whole
+            tmp = self.file_path(key) + '.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(png)
+            os.replace(tmp, self.file_path(key))
+            self.disk_usage += len(png) - old_size
+            if self.disk_usage > self.disk_size:
+                self.prune_disk()
+
+    def prune_disk(self):
+        """Remove least recently used files until under 90% of disk size.
+
+        Called with the lock held.
+        """
+        files = []
+        for f in os.listdir(self.path):
+            if f.endswith('.png'):
+                stat = os.stat(os.path.join(self.path, f))
+                files.append((stat.st_mtime, stat.st_size, f))
+        files.sort()
+        self.disk_usage = sum(size for _, size, _ in files)
+        for _, size, f in files:
+            if self.disk_usage <= self.disk_size * 0.9:
+                break
+            os.remove(os.path.join(self.path, f))
+            self.disk_usage -= size
+
+    def get_url(self, key):
+        """Uploaded image URL, None if not uploaded or expired."""
+        with self.lock:
+            value = self.urls.get(key)
+            if value is None:
+                return None
+            url, expiry = value
+            if expiry <= time.time():
+                del self.urls[key]
+                return None
+            return url
+
+    def set_url(self, key, url):
+        with self.lock:
+            self.urls.pop(key, None)
+            self.urls[key] = [url, time.time() + RENDER_CACHE_URL_TTL]
+            while len(self.urls) > RENDER_CACHE_URLS_SIZE:
+                self.urls.popitem(last=False)
+            dataIO.save_json(RENDER_CACHE_URLS_PATH, self.urls)
+
+
+class DeckRenderer:
+    """Render deck images with Pillow.
+
+    Background, card images and fonts are loaded once and memoized, so
+    each render only composites cards and draws text.
+    """
+
+    card_w = 302
+    card_h = 363
+    card_x = 30
+    card_y = 30
+    font_size = 50
+    txt_y_line1 = 430
+    txt_y_line2 = 500
+    txt_x_name = 50
+    txt_x_cards = 503
+    txt_x_elixir = 1872
+    scale = 0.5
+
+    bg_file = os.path.join("data", "deck", "img", "deck-bg-b.png")
+    cards_path = os.path.join("data", "deck", "img", "cards")
+    font_file_regular = os.path.join("data", "deck", "fonts", "OpenSans-Regular.ttf")
+    font_file_bold = os.path.join("data", "deck", "fonts", "OpenSans-Bold.ttf")
+
+    def __init__(self, cards):
+        """Init.
+
+        :param cards: card list from cards.json, used for elixir costs
+        """
+        self.elixir = {card["key"]: card["elixir"] for card in cards}
+        self._bg_image = None
+        self._card_images = {}
+        self._fonts = None
+
+    @property
+    def bg_image(self):
+        if self._bg_image is None:
+            self._bg_image = Image.open(self.bg_file).convert("RGBA")
+        return self._bg_image
+
+    @property
+    def fonts(self):
+        """Regular and bold fonts."""
+        if self._fonts is None:
+            self._fonts = (
+                ImageFont.truetype(self.font_file_regular, size=self.font_size),
+                ImageFont.truetype(self.font_file_bold, size=self.font_size)
+            )
+        return self._fonts
+
+    def card_image(self, key):
+        """Card image in RGBA, resized to deck dimensions."""
+        image = self._card_images.get(key)
+        if image is None:
+            image = Image.open(os.path.join(self.cards_path, "{}.png".format(key))).convert("RGBA")
+            if image.size != (self.card_w, self.card_h):
+                image = image.resize((self.card_w, self.card_h), Image.LANCZOS)
+            self._card_images[key] = image
+        return image
+
+    def preload(self):
+        """Load all assets up front."""
+        self.bg_image
+        self.fonts
+        for f in os.listdir(self.cards_path):
+            if f.endswith(".png"):
+                self.card_image(f[:-4])
+
+    def average_elixir(self, card_keys):
+        elixirs = [self.elixir.get(key, 0) for key in card_keys]
+        # total card exclude mirror (0-elixir cards)
+        card_count = len([e for e in elixirs if e])
+        return "{:.3f}".format(sum(elixirs) / card_count)
+
+    def render(self, deck, deck_name=None, deck_author_name=""):
+        """Construct the deck image."""
+        image = self.bg_image.copy()
+        size = image.size
+
+        if not deck_name:
+            deck_name = "Deck"
+
+        # cards
+        for i, card in enumerate(deck):
+            card_image = self.card_image(card)
+            card_box = (self.card_x + self.card_w * i,
+                        self.card_y,
+                        self.card_x + self.card_w * (i + 1),
+                        self.card_h + self.card_y)
+            image.paste(card_image, card_box, card_image)
+
+        average_elixir = self.average_elixir(deck)
+
+        # text
+        # Take out hyphnens and capitlize the name of each card
+        card_names = [string.capwords(c.replace('-', ' ')) for c in deck]
+
+        txt = Image.new("RGBA", size)
+        txt_name = Image.new("RGBA", (self.txt_x_cards - 30, size[1]))
+        font_regular, font_bold = self.fonts
+
+        d = ImageDraw.Draw(txt)
+        d_name = ImageDraw.Draw(txt_name)
+
+        line1 = ', '.join(card_names[:4])
+        line2 = ', '.join(card_names[4:])
+
+        d_name.text(
+            (self.txt_x_name, self.txt_y_line1), deck_name, font=font_bold,
+            fill=(0xff, 0xff, 0xff, 255))
+        d_name.text(
+            (self.txt_x_name, self.txt_y_line2), deck_author_name, font=font_regular,
+            fill=(0xff, 0xff, 0xff, 255))
+        d.text(
+            (self.txt_x_cards, self.txt_y_line1), line1, font=font_regular,
+            fill=(0xff, 0xff, 0xff, 255))
+        d.text(
+            (self.txt_x_cards, self.txt_y_line2), line2, font=font_regular,
+            fill=(0xff, 0xff, 0xff, 255))
+        d.text(
+            (self.txt_x_elixir, self.txt_y_line1), "Avg elixir", font=font_bold,
+            fill=(0xff, 0xff, 0xff, 200))
+        d.text(
+            (self.txt_x_elixir, self.txt_y_line2), average_elixir, font=font_bold,
+            fill=(0xff, 0xff, 0xff, 255))
+
+        image.paste(txt, (0, 0), txt)
+        image.paste(txt_name, (0, 0), txt_name)
+
+        # scale down and return
+        scaled_size = tuple([x * self.scale for x in image.size])
+        image.thumbnail(scaled_size)
+
+        return image
+
+    def render_grid(self, entries):
+        """Stack several decks into one image.
+
+        :param entries: list of (deck, deck_name, deck_author_name)
+        """
+        images = [self.render(*entry) for entry in entries]
+        width = max(image.size[0] for image in images)
+        height = sum(image.size[1] for image in images)
+        grid = Image.new("RGBA", (width, height))
+        y = 0
+        for image in images:
+            grid.paste(image, (0, y))
+            y += image.size[1]
+        return grid
+
+
+# Renderer owned by each render worker process
+_worker_renderer = None
+
+
+def _worker_get_renderer():
+    global _worker_renderer
+    if _worker_renderer is None:
+        _worker_renderer = DeckRenderer(dataIO.load_json(CARDS_JSON_PATH))
+        _worker_renderer.preload()
+    return _worker_renderer
+
+
+def _worker_warm():
+    """Load assets in a worker process."""
+    _worker_get_renderer()
+    return os.getpid()
+
+
+def _worker_render_png(deck, deck_name, deck_author_name):
+    """Render deck in a worker process and return PNG bytes."""
+    image = _worker_get_renderer().render(deck, deck_name, deck_author_name)
+    with io.BytesIO() as f:
+        image.save(f, "PNG")
+        return f.getvalue()
+
+
+def _worker_render_grid_png(entries):
+    """Render deck grid in a worker process and return PNG bytes."""
+    image = _worker_get_renderer().render_grid(entries)
+    with io.BytesIO() as f:
+        image.save(f, "PNG")
+        return f.getvalue()
+
+
+class DeckRenderService:
+    """Render deck images in a dedicated process pool.
+
+    Keeps Pillow work off the default executor and out of the bot
+    process GIL. Workers preload their assets when the pool starts.
+    """
+
+    def __init__(self, loop, workers=RENDER_WORKERS):
+        self.loop = loop
+        self.workers = workers
+        self.pool = ProcessPoolExecutor(max_workers=workers)
+        self.queued = 0
+        self.max_queued = 0
+        self.rendered = 0
+        self.render_time = 0.0
+        for _ in range(workers):
+            self.pool.submit(_worker_warm)
+
+    def shutdown(self):
+        self.pool.shutdown(wait=False)
+
+    async def run(self, func, *args):
+        """Run func in the pool and track queue metrics."""
+        self.queued += 1
+        self.max_queued = max(self.max_queued, self.queued)
+        start = time.perf_counter()
+        try:
+            return await self.loop.run_in_executor(self.pool, func, *args)
+        finally:
+            self.queued -= 1
+            self.rendered += 1
+            self.render_time += time.perf_counter() - start
+
+    async def render(self, deck, deck_name=None, deck_author=None):
+        """Render deck and return PNG bytes."""
+        return await self.run(
+            _worker_render_png,
+            list(deck), deck_name, deck_author_name(deck_author))
+
+    async def render_grid(self, entries):
+        """Render list of (deck, deck_name, deck_author) as one image and return PNG bytes."""
+        return await self.run(
+            _worker_render_grid_png,
+            [(list(deck), deck_name, deck_author_name(deck_author)) for deck, deck_name, deck_author in entries])
+
+    def stats(self):
+        return dict(
+            workers=self.workers,
+            queued=self.queued,
+            max_queued=self.max_queued,
+            rendered=self.rendered,
+            avg_ms=self.render_time / self.rendered * 1000 if self.rendered else 0
+        )
+
+
+class DeckStore:
+    """SQLite store of member decks.
+
+    Tables:
+    - members: display names by (server_id, member_id)
+    - decks: one row per deck, unique by (server_id, member_id, timestamp)
+      and indexed by (server_id, timestamp)
+    - deck_cards: card membership, indexed by (server_id, card)
+
+    Every change is a small transaction, so saving a deck does not
+    rewrite other decks.
+    """
+
+    def __init__(self, path=DECKS_DB_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+        with self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS members (
+                    server_id TEXT NOT NULL,
+                    member_id TEXT NOT NULL,
+                    display_name TEXT,
+                    PRIMARY KEY (server_id, member_id)
+                );
+                CREATE TABLE IF NOT EXISTS decks (
+                    id INTEGER PRIMARY KEY,
+                    server_id TEXT NOT NULL,
+                    member_id TEXT NOT NULL,
+                    timestamp TEXT NOT NULL,
+                    name TEXT,
+                    cards TEXT NOT NULL,
+                    UNIQUE (server_id, member_id, timestamp)
+                );
+                CREATE INDEX IF NOT EXISTS decks_timestamp ON decks (server_id, timestamp);
+                CREATE TABLE IF NOT EXISTS deck_cards (
+                    deck_id INTEGER NOT NULL REFERENCES decks (id) ON DELETE CASCADE,
+                    server_id TEXT NOT NULL,
+                    card TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS deck_cards_card ON deck_cards (server_id, card, deck_id);
+                CREATE INDEX IF NOT EXISTS deck_cards_deck ON deck_cards (deck_id);
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    @staticmethod
+    def row_to_deck(row):
+        deck = dict(row)
+        deck["cards"] = deck["cards"].split(",")
+        return deck
+
+    def set_member(self, server_id, member_id, display_name):
+        """Add member if not already stored."""
+        with self.conn:
+            self.conn.execute(
+                "INSERT OR IGNORE INTO members (server_id, member_id, display_name) VALUES (?, ?, ?)",
+                (server_id, member_id, display_name))
+
+    def member_decks(self, server_id, member_id):
+        """Decks of a member, oldest first."""
+        rows = self.conn.execute(
+            "SELECT * FROM decks WHERE server_id = ? AND member_id = ? ORDER BY timestamp",
+            (server_id, member_id))
+        return [self.row_to_deck(row) for row in rows]
+
+    def add_deck(self, server_id, member_id, timestamp, name, cards, max_decks=None):
+        """Add deck. If max_decks is set, remove the member’s oldest decks over it."""
+        with self.conn:
+            deck_id = self._insert(server_id, member_id, timestamp, name, cards)
+            if max_decks is not None:
+                self._trim(server_id, member_id, max_decks)
+        return deck_id
+
+    def _insert(self, server_id, member_id, timestamp, name, cards, ignore=False):
+        """Insert deck and its cards. Return deck id, None if ignored as a duplicate."""
+        cursor = self.conn.execute(
+            "INSERT {}INTO decks (server_id, member_id, timestamp, name, cards) VALUES (?, ?, ?, ?, ?)".format(
+                "OR IGNORE " if ignore else ""),
+            (server_id, member_id, timestamp, name, ",".join(cards)))
+        if not cursor.rowcount:
+            return None
+        deck_id = cursor.lastrowid
+        self.conn.executemany(
+            "INSERT INTO deck_cards (deck_id, server_id, card) VALUES (?, ?, ?)",
+            [(deck_id, server_id, card) for card in set(cards)])
+        return deck_id
+
+    def _trim(self, server_id, member_id, max_decks):
+        """Remove the member’s oldest decks over max_decks. Return their ids."""
+        old_ids = [row[0] for row in self.conn.execute(
+            "SELECT id FROM decks WHERE server_id = ? AND member_id = ? "
+            "ORDER BY timestamp DESC LIMIT -1 OFFSET ?",
+            (server_id, member_id, max_decks))]
+        self._remove(old_ids)
+        return old_ids
+
+    def rename_deck(self, deck_id, name):
+        with self.conn:
+            self.conn.execute("UPDATE decks SET name = ? WHERE id = ?", (name, deck_id))
+
+    def remove_deck(self, deck_id):
+        with self.conn:
+            self._remove([deck_id])
+
+    def _remove(self, deck_ids):
+        self.conn.executemany("DELETE FROM deck_cards WHERE deck_id = ?", [(i,) for i in deck_ids])
+        self.conn.executemany("DELETE FROM decks WHERE id = ?", [(i,) for i in deck_ids])
+
+    def search(self, server_id, cards):
+        """Decks on server containing all cards, newest first."""
+        cards = sorted(set(cards))
+        rows = self.conn.execute(
+            "SELECT decks.*, COALESCE(members.display_name, decks.member_id) AS display_name FROM decks "
+            "LEFT JOIN members ON members.server_id = decks.server_id AND members.member_id = decks.member_id "
+            "WHERE decks.id IN ("
+            "  SELECT deck_id FROM deck_cards WHERE server_id = ? AND card IN ({}) "
+            "  GROUP BY deck_id HAVING COUNT(*) = ?"
+            ") ORDER BY decks.timestamp DESC".format(",".join("?" * len(cards))),
+            [server_id] + cards + [len(cards)])
+        return [self.row_to_deck(row) for row in rows]
+
+    def migrate_settings(self, servers, max_decks=None):
+        """Import decks from legacy settings["Servers"].
+
+        Decks already in the store are skipped, so importing the same
+        settings again is harmless.
+
+        :return: number of decks imported
+        """
+        count = 0
+        for server_id, server_settings in servers.items():
+            for member_id, member in server_settings.get("Members", {}).items():
+                self.set_member(server_id, member_id, member.get("MemberDisplayName"))
+                with self.conn:
+                    deck_ids = set()
+                    for timestamp, deck in sorted(member.get("Decks", {}).items()):
+                        deck_ids.add(self._insert(
+                            server_id, member_id, timestamp, deck["DeckName"], deck["Deck"], ignore=True))
+                    deck_ids.discard(None)
+                    if max_decks is not None:
+                        deck_ids.difference_update(self._trim(server_id, member_id, max_decks))
+                    count += len(deck_ids)
+        return count
+
+
 class Deck:
     """Clash Royale Deck Builder."""
 
@@ -82,6 +634,8 @@ class Deck:
         self.bot = bot
         self.settings = dataIO.load_json(SETTINGS_PATH)
         self.cards = dataIO.load_json(CARDS_JSON_PATH)
+        self.decklink_keys = {str(card["id"]): card["key"] for card in self.cards}
+        self.key_decklinks = {card["key"]: str(card["id"]) for card in self.cards}
 
         # init card data
         self.cards_abbrev = {}
@@ -112,10 +666,30 @@ class Deck:
         # Used for Pillow blocking code
         self.threadex = ThreadPoolExecutor(max_workers=2)
 
+        self.image_cache = DeckImageCache()
+        self.store = DeckStore()
+        if any("Members" in server for server in self.settings["Servers"].values()):
+            self.migrate_settings()
+        self.renderer = DeckRenderer(self.cards)
+        self.render_service = DeckRenderService(
+            self.bot.loop, workers=self.settings.get("RenderWorkers", RENDER_WORKERS))
+
+    def __unload(self):
+        self.render_service.shutdown()
+        self.store.close()
+
+    def migrate_settings(self):
+        """Move member decks from settings.json to the deck store."""
+        count = self.store.migrate_settings(self.settings["Servers"], max_decks=max_deck_per_user)
+        for server in self.settings["Servers"].values():
+            server.pop("Members", None)
+        self.save_settings()
+        return count
+
     @property
     def valid_card_keys(self):
         """Valid card keys."""
-        return [card["key"] for card in self.cards]
+        return self.key_decklinks.keys()
 
     async def cards_json(self):
         url = CARDS_JSON_URL
@@ -197,6 +771,80 @@ class Deck:
         await self.bot.say("Auto deck link: {}".format(auto_deck_link))
         self.save_settings()
 
+    @deckset.command(name="migrate", pass_context=True)
+    @checks.is_owner()
+    async def deckset_migrate(self, ctx, path=None):
+        """Import member decks from a legacy settings.json.
+
+        Defaults to the current settings file.
+        """
+        if path is None:
+            count = self.migrate_settings()
+        else:
+            count = self.store.migrate_settings(
+                dataIO.load_json(path).get("Servers", {}), max_decks=max_deck_per_user)
+        await self.bot.say("Imported {} decks.".format(count))
+
+    @deckset.command(name="renderworkers", pass_context=True)
+    @checks.is_owner()
+    async def deckset_renderworkers(self, ctx, workers: int):
+        """Set number of deck image render processes."""
+        if workers < 1:
+            await self.bot.say("There must be at least 1 worker.")
+            return
+        render_service = DeckRenderService(self.bot.loop, workers=workers)
+        self.render_service.shutdown()
+        self.render_service = render_service
+        self.settings["RenderWorkers"] = workers
+        self.save_settings()
+        await self.bot.say("Deck images will be rendered by {} workers.".format(workers))
+
+    @deckset.command(name="renderstats", pass_context=True)
+    @checks.is_owner()
+    async def deckset_renderstats(self, ctx):
+        """Show render service queue metrics."""
+        stats = self.render_service.stats()
+        out = [
+            "Workers: {workers}",
+            "Queued: {queued}",
+            "Max queued: {max_queued}",
+            "Rendered: {rendered}",
+            "Avg time: {avg_ms:.1f} ms",
+        ]
+        await self.bot.say(box("\n".join(out).format(**stats)))
+
+    @deckset.command(name="benchmark", pass_context=True)
+    @checks.is_owner()
+    async def deckset_benchmark(self, ctx, count: int = 50):
+        """Report deck image renders per second, bypassing the image cache."""
+        await self.bot.type()
+
+        def run():
+            keys = [card["key"] for card in self.cards]
+            decks = [random.sample(keys, 8) for _ in range(count)]
+            results = []
+
+            start = time.perf_counter()
+            for deck in decks:
+                DeckRenderer(self.cards).render(deck, "Benchmark", "Author")
+            results.append(("cold", time.perf_counter() - start))
+
+            start = time.perf_counter()
+            for deck in decks:
+                self.renderer.render(deck, "Benchmark", "Author")
+            results.append(("preloaded", time.perf_counter() - start))
+
+            start = time.perf_counter()
+            for deck in decks:
+                with io.BytesIO() as f:
+                    self.renderer.render(deck, "Benchmark", "Author").save(f, "PNG")
+            results.append(("preloaded + png", time.perf_counter() - start))
+            return results
+
+        results = await self.bot.loop.run_in_executor(self.threadex, run)
+        out = ["{:<16}: {:>8.2f} renders / s".format(name, count / elapsed) for name, elapsed in results]
+        await self.bot.say(box("\n".join(out), lang="py"))
+
     @commands.group(pass_context=True, no_pm=True)
     async def deck(self, ctx):
         """Clash Royale deck builder.
@@ -257,17 +905,11 @@ class Deck:
 
     async def card_decklink_to_key(self, decklink):
         """Decklink id to card."""
-        for card in self.cards:
-            if decklink == str(card["id"]):
-                return card["key"]
-        return None
+        return self.decklink_keys.get(decklink)
 
     async def card_key_to_decklink(self, key):
         """Card key to decklink id."""
-        for card in self.cards:
-            if key == card["key"]:
-                return str(card["id"])
-        return None
+        return self.key_decklinks.get(key)
 
     async def decklink_to_cards(self, url):
         """Convert decklink to cards."""
@@ -276,21 +918,20 @@ class Deck:
         # https://link.clashroyale.com/deck/en?deck=26000015;28000015;26000027;26000085;27000012;26000023;28000007;28000012&id=2R900UR
         from urllib.parse import unquote
         url = unquote(url)
-        m_crlink = re.search('(http|ftp|https)://link.clashroyale.com/deck/..\?deck=([\d\;]+)', url)
+        m_crlink = CRLINK_RE.search(url)
 
         # search for royaleapi deck stats link
-        m_rapilink = re.match('(https|http)://royaleapi.com/decks/stats/([a-z,-]+)/?', url)
-        m_rapilink_section = re.match('(https|http)://royaleapi.com/decks/stats/([a-z,-]+)/.+', url)
+        m_rapilink = RAPILINK_RE.match(url)
+        m_rapilink_section = RAPILINK_SECTION_RE.match(url)
 
         if m_crlink:
             try:
                 url = m_crlink.group(2)
-                decklinks = re.findall('2\d{7}', url)
-                card_keys = []
-                for decklink in decklinks:
-                    card_key = await self.card_decklink_to_key(decklink)
-                    if card_key is not None:
-                        card_keys.append(card_key)
+                decklinks = CRLINK_ID_RE.findall(url)
+                card_keys = [
+                    self.decklink_keys[decklink] for decklink in decklinks
+                    if decklink in self.decklink_keys
+                ]
             except IndexError:
                 # no such group, ignore
                 pass
@@ -350,25 +991,12 @@ class Deck:
 
             await self.deck_upload(ctx, member_deck, deck_name)
 
-            decks = self.settings["Servers"][server.id]["Members"][author.id]["Decks"]
-
             if self.deck_is_valid:
                 await self.bot.say("Deck added.")
-                deck_key = str(datetime.datetime.utcnow())
-                decks[deck_key] = {
-                    "Deck": member_deck,
-                    "DeckName": deck_name
-                }
-
                 # If user has more than allowed by max, remove older decks
-                timestamp = decks.keys()
-                timestamp = sorted(timestamp)
-
-                while len(decks) > max_deck_per_user:
-                    t = timestamp.pop(0)
-                    decks.pop(t, None)
-
-                self.save_settings()
+                self.store.add_deck(
+                    server.id, author.id, str(datetime.datetime.utcnow()), deck_name, member_deck,
+                    max_decks=max_deck_per_user)
 
     @deck.command(name="list", pass_context=True, no_pm=True)
     async def deck_list(self, ctx, member: discord.Member = None):
@@ -382,18 +1010,17 @@ class Deck:
             member = author
             member_is_author = True
 
-        self.check_server_settings(server)
         self.check_member_settings(server, member)
 
-        decks = self.settings["Servers"][server.id]["Members"][member.id]["Decks"]
+        decks = self.store.member_decks(server.id, member.id)
 
         deck_id = 1
 
-        for k, deck in decks.items():
+        for deck in decks:
             await self.upload_deck_image(
-                ctx, deck["Deck"], deck["DeckName"], member,
-                description="**{}**. {}".format(deck_id, deck["DeckName"]))
-            await self.decklink(ctx, deck["Deck"])
+                ctx, deck["cards"], deck["name"], member,
+                description="**{}**. {}".format(deck_id, deck["name"]))
+            await self.decklink(ctx, deck["cards"])
             deck_id += 1
 
         if not len(decks):
@@ -415,10 +1042,9 @@ class Deck:
             member = author
             member_is_author = True
 
-        self.check_server_settings(server)
         self.check_member_settings(server, member)
 
-        decks = self.settings["Servers"][server.id]["Members"][member.id]["Decks"]
+        decks = self.store.member_decks(server.id, member.id)
 
         if not len(decks):
             if member_is_author:
@@ -430,10 +1056,10 @@ class Deck:
 
         deck_id = 1
         results_max = 3
-        for k, deck in decks.items():
+        for deck in decks:
             await self.upload_deck_image(
-                ctx, deck["Deck"], deck["DeckName"], member,
-                description="**{}**. {}".format(deck_id, deck["DeckName"]))
+                ctx, deck["cards"], deck["name"], member,
+                description="**{}**. {}".format(deck_id, deck["name"]))
             deck_id += 1
 
             if (deck_id - 1) % results_max == 0:
@@ -458,9 +1084,8 @@ class Deck:
         server = ctx.message.server
         if not member:
             member = author
-        self.check_server_settings(server)
-        members = self.settings["Servers"][server.id]["Members"]
-        if not member.id in members:
+        decks = self.store.member_decks(server.id, member.id)
+        if not decks:
             await self.bot.say("You have not added any decks.")
         elif deck_id is None:
             await self.bot.say("You must enter a deck id.")
@@ -468,13 +1093,12 @@ class Deck:
             await self.bot.say("The deck_id you have entered is not a number.")
         else:
             deck_id = int(deck_id) - 1
-            decks = members[member.id]["Decks"]
-            for i, deck in enumerate(decks.values()):
+            for i, deck in enumerate(decks):
                 if i == deck_id:
-                    await self.deck_upload(ctx, deck["Deck"],
-                                           deck["DeckName"], member)
+                    await self.deck_upload(ctx, deck["cards"],
+                                           deck["name"], member)
                     # generate link
-                    await self.decklink(ctx, deck["Deck"])
+                    await self.decklink(ctx, deck["cards"])
 
     async def decklink(self, ctx, deck_cards):
         """Show deck link depending on settings."""
@@ -534,7 +1158,6 @@ class Deck:
     async def deck_search(self, ctx, *params):
         """Search all decks by cards."""
         server = ctx.message.server
-        server_members = self.settings["Servers"][server.id]["Members"]
 
         if not len(params):
             await self.bot.say("You must enter at least one card to search.")
@@ -543,65 +1166,23 @@ class Deck:
             # normalize params
             params = self.normalize_deck_data(params)
 
-            found_decks = []
-
-            for k, server_member in server_members.items():
-                member_decks = server_member["Decks"]
-                member_id = server_member["MemberID"]
-                member_display_name = server_member["MemberDisplayName"]
-                member = server.get_member(member_id)
-                for k, member_deck in member_decks.items():
-                    cards = member_deck["Deck"]
-                    # await self.bot.say(set(params))
-                    if set(params) < set(cards):
-                        found_decks.append({
-                            "UTC": k,
-                            "Deck": member_deck["Deck"],
-                            "DeckName": member_deck["DeckName"],
-                            "Member": member,
-                            "MemberDisplayName": member_display_name
-                        })
-            found_decks = sorted(
-                found_decks, key=lambda x: x["UTC"], reverse=True)
+            found_decks = self.store.search(server.id, params)
 
             await self.bot.say("Found {} decks".format(len(found_decks)))
 
             if len(found_decks):
-
-                results_max = 3
-
-                deck_id = 1
-
-                for deck in found_decks:
-                    timestamp = deck["UTC"][:19]
-
-                    description = "**{}. {}** by {} — {}".format(
-                        deck_id, deck["DeckName"],
-                        deck["MemberDisplayName"],
-                        timestamp)
-                    await self.upload_deck_image(
-                        ctx, deck["Deck"], deck["DeckName"], deck["Member"],
-                        description=description)
-
-                    deck_id += 1
-
-                    if (deck_id - 1) % results_max == 0:
-                        if deck_id < len(found_decks):
-
-                            def pagination_check(m):
-                                return m.content.lower() == 'y'
-
-                            await self.bot.say(
-                                "Would you like to see the next results? (Y/N)")
-
-                            answer = await self.bot.wait_for_message(
-                                timeout=10.0,
-                                author=ctx.message.author,
-                                check=pagination_check)
-
-                            if answer is None:
-                                await self.bot.say("Search results aborted.")
-                                return
+                entries = []
+                for i, deck in enumerate(found_decks, 1):
+                    entries.append(dict(
+                        deck=deck["cards"],
+                        deck_name="{}. {}".format(i, deck["name"]),
+                        deck_author=deck["display_name"],
+                        description="**{}. {}** by {} — {}".format(
+                            i, deck["name"],
+                            deck["display_name"],
+                            deck["timestamp"][:19])
+                    ))
+                await self.deck_grid_menu(ctx, entries)
 
     @deck.command(name="rename", pass_context=True, no_pm=True)
     async def deck_rename(self, ctx, deck_id, new_name):
@@ -613,27 +1194,22 @@ class Deck:
         server = ctx.message.server
         author = ctx.message.author
 
-        members = self.settings["Servers"][server.id]["Members"]
+        decks = self.store.member_decks(server.id, author.id)
 
         # check member has data
-        if author.id not in members:
-            self.bot.say("You have not added any decks.")
+        if not decks:
+            await self.bot.say("You have not added any decks.")
         elif not deck_id.isdigit():
             await self.bot.say("The deck_id you have entered is not a number.")
         else:
             deck_id = int(deck_id) - 1
-            member = members[author.id]
-            decks = member["Decks"]
             if deck_id >= len(decks):
                 await self.bot.say("The deck id you have entered is invalid.")
             else:
-                for i, deck in enumerate(decks.values()):
-                    if deck_id == i:
-                        # await self.bot.say(deck["DeckName"])
-                        deck["DeckName"] = new_name
-                        await self.bot.say("Deck renamed to {}.".format(new_name))
-                        await self.deck_upload(ctx, deck["Deck"], new_name, author)
-                        self.save_settings()
+                deck = decks[deck_id]
+                self.store.rename_deck(deck["id"], new_name)
+                await self.bot.say("Deck renamed to {}.".format(new_name))
+                await self.deck_upload(ctx, deck["cards"], new_name, author)
 
     @deck.command(name="remove", pass_context=True, no_pm=True)
     async def deck_remove(self, ctx, deck_id):
@@ -641,26 +1217,19 @@ class Deck:
         server = ctx.message.server
         author = ctx.message.author
 
-        members = self.settings["Servers"][server.id]["Members"]
+        decks = self.store.member_decks(server.id, author.id)
 
-        if not author.id in members:
+        if not decks:
             await self.bot.say("You have not added any decks.")
         elif not deck_id.isdigit():
             await self.bot.say("The deck_id you have entered is not a number.")
         else:
             deck_id = int(deck_id) - 1
-            member = members[author.id]
-            decks = member["Decks"]
             if deck_id >= len(decks):
                 await self.bot.say("The deck id you have entered is invalid.")
             else:
-                remove_key = ""
-                for i, key in enumerate(decks.keys()):
-                    if deck_id == i:
-                        remove_key = key
-                decks.pop(remove_key)
+                self.store.remove_deck(decks[deck_id]["id"])
                 await self.bot.say("Deck {} removed.".format(deck_id + 1))
-                self.save_settings()
 
     @deck.command(name="help", pass_context=True, no_pm=True)
     async def deck_help(self, ctx):
@@ -712,45 +1281,90 @@ class Deck:
 
         self.deck_is_valid = deck_is_valid
 
-    async def upload_deck_image(self, ctx, deck, deck_name, author, description=""):
-        """Upload deck image to the server."""
-
-        deck_image = await self.bot.loop.run_in_executor(
-            None,
-            self.get_deck_image,
-            deck, deck_name, author
-        )
+    async def deck_png(self, deck, deck_name=None, deck_author=None):
+        """Deck image as PNG bytes, rendered by the render service on cache miss."""
+        key = self.image_cache.key(deck, deck_name, deck_author)
+        png = self.image_cache.get_memory(key)
+        if png is None:
+            png = await self.bot.loop.run_in_executor(self.threadex, self.image_cache.get, key)
+        if png is None:
+            png = await self.render_service.render(deck, deck_name, deck_author)
+            await self.bot.loop.run_in_executor(self.threadex, self.image_cache.set, key, png)
+        return png
+
+    async def deck_pngs(self, jobs):
+        """PNG bytes for a list of (deck, deck_name, deck_author).
+
+        Cache misses are rendered concurrently across render workers.
+        A job that fails returns its exception instead of PNG bytes.
+        """
+        return await asyncio.gather(*[self.deck_png(*job) for job in jobs], return_exceptions=True)
 
-        # construct a filename using first three letters of each card
-        filename = "deck-{}.png".format("-".join([card[:3] for card in deck]))
+    async def deck_grid_menu(self, ctx, entries, per_page=DECKS_PER_PAGE):
+        """Show decks as one image per page, navigated with reactions.
 
+        :param entries: list of dicts with deck, deck_name, deck_author and
+                        description, shown as the page message text.
+        """
+        pages = [entries[i:i + per_page] for i in range(0, len(entries), per_page)]
+        channel = ctx.message.channel
+        page = 0
         message = None
 
-        with io.BytesIO() as f:
-            deck_image.save(f, "PNG")
-            f.seek(0)
-            message = await ctx.bot.send_file(
-                ctx.message.channel, f,
-                filename=filename, content=description)
+        while True:
+            page_entries = pages[page]
+            png = await self.render_service.render_grid([
+                (e["deck"], e["deck_name"], e["deck_author"]) for e in page_entries
+            ])
+            content = "\n".join([e["description"] for e in page_entries])
+            if len(pages) > 1:
+                content += "\nPage {}/{}".format(page + 1, len(pages))
 
-        return message
+            if message is not None:
+                try:
+                    await self.bot.delete_message(message)
+                except discord.DiscordException:
+                    pass
+            with io.BytesIO(png) as f:
+                message = await self.bot.send_file(
+                    channel, f, filename="decks-{}.png".format(page + 1), content=content)
+
+            if len(pages) == 1:
+                return
+
+            for emoji in (numbs["back"], numbs["exit"], numbs["next"]):
+                await self.bot.add_reaction(message, emoji)
+
+            react = await self.bot.wait_for_reaction(
+                list(numbs.values()), user=ctx.message.author,
+                timeout=PAGINATION_TIMEOUT, message=message)
+
+            if react is None or react.reaction.emoji == numbs["exit"]:
+                try:
+                    await self.bot.clear_reactions(message)
+                except discord.DiscordException:
+                    pass
+                return
+            if react.reaction.emoji == numbs["next"]:
+                page = (page + 1) % len(pages)
+            else:
+                page = (page - 1) % len(pages)
+
+    async def upload_deck_image(self, ctx, deck, deck_name, author, description=""):
+        """Upload deck image to the server."""
+        return await self.upload_deck_image_to(
+            ctx.message.channel, deck, deck_name, author, description=description)
 
     async def upload_deck_image_to(self, channel, deck, deck_name, author, description=""):
         """Upload deck image to destination."""
-        deck_image = await self.bot.loop.run_in_executor(
-            None,
-            self.get_deck_image,
-            deck, deck_name, author
-        )
+        png = await self.deck_png(deck, deck_name, author)
 
         # construct a filename using first three letters of each card
         filename = "deck-{}.png".format("-".join([card[:3] for card in deck]))
 
         message = None
 
-        with io.BytesIO() as f:
-            deck_image.save(f, "PNG")
-            f.seek(0)
+        with io.BytesIO(png) as f:
             message = await self.bot.send_file(
                 channel, f,
                 filename=filename, content=description)
@@ -775,112 +1389,7 @@ class Deck:
 
     def get_deck_image(self, deck, deck_name=None, deck_author=None):
         """Construct the deck with Pillow and return image."""
-        card_w = 302
-        card_h = 363
-        card_x = 30
-        card_y = 30
-        font_size = 50
-        txt_y_line1 = 430
-        txt_y_line2 = 500
-        txt_x_name = 50
-        txt_x_cards = 503
-        txt_x_elixir = 1872
-
-        bg_image = Image.open("data/deck/img/deck-bg-b.png")
-        size = bg_image.size
-
-        font_file_regular = "data/deck/fonts/OpenSans-Regular.ttf"
-        font_file_bold = "data/deck/fonts/OpenSans-Bold.ttf"
-
-        image = Image.new("RGBA", size)
-        image.paste(bg_image)
-
-        if not deck_name:
-            deck_name = "Deck"
-
-        # cards
-        for i, card in enumerate(deck):
-            card_image_file = "data/deck/img/cards/{}.png".format(card)
-            card_image = Image.open(card_image_file)
-            # size = (card_w, card_h)
-            # card_image.thumbnail(size)
-            box = (card_x + card_w * i,
-                   card_y,
-                   card_x + card_w * (i + 1),
-                   card_h + card_y)
-            image.paste(card_image, box, card_image)
-
-        # # elixir
-        # total_elixir = 0
-        # # total card exclude mirror (0-elixir cards)
-        # card_count = 0
-        #
-        # for card in self.cards:
-        #     if card["key"] in deck:
-        #         total_elixir += card["elixir"]
-        #         if card["elixir"]:
-        #             card_count += 1
-        #
-        # average_elixir = "{:.3f}".format(total_elixir / card_count)
-
-        average_elixir = self.get_deck_elxiir(deck)
-
-        # text
-        # Take out hyphnens and capitlize the name of each card
-        card_names = [string.capwords(c.replace('-', ' ')) for c in deck]
-
-        txt = Image.new("RGBA", size)
-        txt_name = Image.new("RGBA", (txt_x_cards - 30, size[1]))
-        font_regular = ImageFont.truetype(font_file_regular, size=font_size)
-        font_bold = ImageFont.truetype(font_file_bold, size=font_size)
-
-        d = ImageDraw.Draw(txt)
-        d_name = ImageDraw.Draw(txt_name)
-
-        line1 = ', '.join(card_names[:4])
-        line2 = ', '.join(card_names[4:])
-        # card_text = '\n'.join([line0, line1])
-
-        if deck_author:
-            if isinstance(deck_author, str):
-                deck_author_name = deck_author
-            elif hasattr(deck_author, "name"):
-                deck_author_name = deck_author.name
-            else:
-                deck_author_name = ""
-        else:
-            deck_author_name = ""
-
-        # deck_author_name = deck_author.name if deck_author else ""
-
-        d_name.text(
-            (txt_x_name, txt_y_line1), deck_name, font=font_bold,
-            fill=(0xff, 0xff, 0xff, 255))
-        d_name.text(
-            (txt_x_name, txt_y_line2), deck_author_name, font=font_regular,
-            fill=(0xff, 0xff, 0xff, 255))
-        d.text(
-            (txt_x_cards, txt_y_line1), line1, font=font_regular,
-            fill=(0xff, 0xff, 0xff, 255))
-        d.text(
-            (txt_x_cards, txt_y_line2), line2, font=font_regular,
-            fill=(0xff, 0xff, 0xff, 255))
-        d.text(
-            (txt_x_elixir, txt_y_line1), "Avg elixir", font=font_bold,
-            fill=(0xff, 0xff, 0xff, 200))
-        d.text(
-            (txt_x_elixir, txt_y_line2), average_elixir, font=font_bold,
-            fill=(0xff, 0xff, 0xff, 255))
-
-        image.paste(txt, (0, 0), txt)
-        image.paste(txt_name, (0, 0), txt_name)
-
-        # scale down and return
-        scale = 0.5
-        scaled_size = tuple([x * scale for x in image.size])
-        image.thumbnail(scaled_size)
-
-        return image
+        return self.renderer.render(deck, deck_name, deck_author_name(deck_author))
 
     def normalize_deck_data(self, deck):
         """Return a deck list with normalized names."""
@@ -895,29 +1404,15 @@ class Deck:
 
     def check_member_settings(self, server, member):
         """Init member section if necessary."""
-        if member.id not in self.settings["Servers"][server.id]["Members"]:
-            self.settings["Servers"][server.id]["Members"][member.id] = {
-                "MemberID": member.id,
-                "MemberDisplayName": member.display_name,
-                "Decks": {}
-            }
-            self.save_settings()
+        self.store.set_member(server.id, member.id, member.display_name)
 
     def check_server_settings(self, server):
         """Init server data if necessary."""
-        if server.id not in self.settings["Servers"]:
-            self.settings["Servers"][server.id] = {
-                "ServerName": str(server),
-                "ServerID": str(server.id),
-                "Members": {}
-            }
-        if "Members" not in self.settings["Servers"][server.id]:
-            self.settings["Servers"][server.id]["Members"] = {}
-        if "ServerName" not in self.settings["Servers"][server.id]:
-            self.settings["Servers"][server.id]["ServerName"] = str(server)
-        if "ServerID" not in self.settings["Servers"][server.id]:
-            self.settings["Servers"][server.id]["ServerID"] = str(server.id)
-        self.save_settings()
+        server_settings = self.settings["Servers"].setdefault(server.id, {})
+        if "ServerName" not in server_settings or "ServerID" not in server_settings:
+            server_settings.setdefault("ServerName", str(server))
+            server_settings.setdefault("ServerID", str(server.id))
+            self.save_settings()
 
     def save_settings(self):
         """Save data to settings file."""
@@ -928,7 +1423,9 @@ class Deck:
         server = msg.server
         if server is None:
             return
-        self.check_server_settings(server)
+        content = msg.content
+        if not any(hint in content for hint in DECKLINK_HINTS):
+            return
         try:
             auto_deck_link = self.settings["Servers"][server.id].get('auto_deck_link', False)
         except KeyError:
@@ -967,10 +1464,13 @@ class Deck:
             img_server = discord.utils.get(self.bot.servers, id=img_server_id)
             img_channel = discord.utils.get(img_server.channels, id=img_channel_id)
             if img_channel:
-                img_msg = await self.upload_deck_image_to(img_channel, card_keys, deck_name,
-                                                          deck_author or self.bot.name)
-
-                img_url = img_msg.attachments[0].get('url')
+                deck_author = deck_author or self.bot.user.name
+                image_key = self.image_cache.key(card_keys, deck_name, deck_author)
+                img_url = self.image_cache.get_url(image_key)
+                if img_url is None:
+                    img_msg = await self.upload_deck_image_to(img_channel, card_keys, deck_name, deck_author)
+                    img_url = img_msg.attachments[0].get('url')
+                    self.image_cache.set_url(image_key, img_url)
                 if link is not None:
                     url = link
                 else:
@@ -1014,7 +1514,7 @@ class Deck:
                 has_image_server = True
 
         if not has_image_server:
-            msg = await self.upload_deck_image_to(channel, card_keys, "Deck", deck_author or self.bot.name)
+            msg = await self.upload_deck_image_to(channel, card_keys, "Deck", deck_author or self.bot.user.name)
             # await self.upload_deck_image(ctx, deck, deck_name, member)
             await self.bot.send_message(channel, embed=await self.decklink_embed(card_keys))
 
@@ -1026,7 +1526,8 @@ def check_folder():
     folders = [
         os.path.join("data", "deck"),
         os.path.join("data", "deck", "img"),
-        os.path.join("data", "deck", "img", "cards")]
+        os.path.join("data", "deck", "img", "cards"),
+        RENDER_CACHE_PATH]
     for f in folders:
         if not os.path.exists(f):
             print("Creating {} folder".format(f))
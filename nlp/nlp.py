@@ -23,7 +23,10 @@ LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING
 FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER
 DEALINGS IN THE SOFTWARE.
 """
+import hashlib
+import logging
 import os
+import time
 from collections import OrderedDict
 
 import discord
@@ -34,9 +37,15 @@ from discord.ext.commands import Context
 import asyncio
 from functools import partial
 
+logger = logging.getLogger(__name__)
+
 PATH = os.path.join("data", "nlp")
 JSON = os.path.join(PATH, "settings.json")
 
+CACHE_SIZE = 4096
+CACHE_TTL = 60 * 60 * 24
+LANGID_MIN_PROB = 0.9
+
 try:
     import textblob
     from textblob import TextBlob
@@ -49,6 +58,18 @@ try:
 except ImportError:
     raise ImportError("Please install the googletrans package from pip") from None
 
+try:
+    from langid.langid import LanguageIdentifier, model as langid_model
+    langid_identifier = LanguageIdentifier.from_modelstring(langid_model, norm_probs=True)
+except ImportError:
+    langid_identifier = None
+
+# langid codes which differ from Google Translate
+LANGID_CODES = {
+    'zh': 'zh-cn',
+    'he': 'iw',
+}
+
 LANG = OrderedDict([
     ("af", "Afrikaans"),
     ("ar", "Arabic"),
@@ -208,18 +229,56 @@ LANGUAGES = {
 }
 
 
+class TTLCache:
+    """LRU cache where entries also expire after ttl seconds."""
+
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.data = OrderedDict()
+
+    def get(self, key):
+        """Return cached value, None if missing or expired."""
+        item = self.data.get(key)
+        if item is None:
+            return None
+        value, expires = item
+        if expires < time.monotonic():
+            del self.data[key]
+            return None
+        self.data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self.data[key] = (value, time.monotonic() + self.ttl)
+        self.data.move_to_end(key)
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+
+def text_hash(text):
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
 class NLP:
     """Natural Launguage Processing.
     """
 
     def __init__(self, bot):
         self.bot = bot
-        self.translator = Translator()
         self.settings = dataIO.load_json(JSON)
+        self.translations = TTLCache()
+        self.detections = TTLCache()
 
     async def _translate(self, text, dest='en'):
+        key = (text_hash(text), dest)
+        r = self.translations.get(key)
+        if r is not None:
+            return r
+
         def do_translate(text, dest=dest):
-            r = self.translator.translate(text, dest=dest)
+            # Translator is not thread safe: one per executor call
+            r = Translator().translate(text, dest=dest)
             return r.text
         loop = asyncio.get_event_loop()
         r = await loop.run_in_executor(
@@ -230,8 +289,58 @@ class NLP:
                 dest=dest
             )
         )
+        self.translations.set(key, r)
         return r
 
+    async def _detect_language(self, text):
+        """Detect language of text.
+
+        Uses the local langid model if installed and confident,
+        otherwise the remote TextBlob detection in an executor.
+        """
+        key = text_hash(text)
+        lang = self.detections.get(key)
+        if lang is not None:
+            return lang
+
+        if langid_identifier is not None:
+            lang, prob = langid_identifier.classify(text)
+            lang = LANGID_CODES.get(lang, lang)
+            if prob < LANGID_MIN_PROB:
+                lang = None
+
+        if lang is None:
+            loop = asyncio.get_event_loop()
+            lang = await loop.run_in_executor(
+                None,
+                TextBlob(text).detect_language
+            )
+
+        self.detections.set(key, lang)
+        return lang
+
+    async def translate_languages(self, text, languages):
+        """Translate text to all languages concurrently.
+
+        Languages matching the detected language are skipped, as are
+        languages which fail to translate.
+
+        :return: detected language, list of (language, translated text)
+        """
+        detected_lang = await self._detect_language(text)
+        languages = [lang for lang in languages if lang != detected_lang]
+        results = await asyncio.gather(
+            *[self._translate(text, dest=lang) for lang in languages],
+            return_exceptions=True
+        )
+        out = []
+        for lang, result in zip(languages, results):
+            if isinstance(result, Exception):
+                logger.warning("Translation to %s failed: %s", lang, result)
+                continue
+            out.append((lang, result))
+        return detected_lang, out
+
     @commands.command(pass_context=True)
     async def translate(self, ctx: Context, to_lang: str, *, text: str):
         """Translate to another language.
@@ -368,23 +477,12 @@ class NLP:
             if msg.author.bot:
                 return
             if self.settings[server.id]["AUTO_TRANSLATE"]:
-                blob = TextBlob(msg.content)
-                detected_lang = blob.detect_language()
-                out = []
-                for language in self.settings[server.id]["LANGUAGE"]:
-                    if language != detected_lang:
-                        try:
-                            translated_msg = await self._translate(msg.content, dest=language)
-                            # translated_msg = blob.translate(to=language)
-                            out.append(
-                                "`{}` {}".format(
-                                    language, translated_msg))
-                        except Exception as e:
-                            print(e)
-
-                        # except (textblob.exceptions.NotTranslated,
-                        #         textblob.exceptions.TranslatorError):
-                        #     pass
+                detected_lang, translations = await self.translate_languages(
+                    msg.content, self.settings[server.id]["LANGUAGE"])
+                out = [
+                    "`{}` {}".format(language, translated_msg)
+                    for language, translated_msg in translations
+                ]
                 if len(out):
                     out.insert(0,
                                "{}\n`{}` {}".format(
@@ -423,32 +521,22 @@ class NLP:
             return
         if msg.author.bot:
             return
-        blob = TextBlob(msg.content)
-        detected_lang = blob.detect_language()
-        out = []
-        for language in settings.get("languages"):
-            if language != detected_lang:
-                try:
-                    # translated_msg = blob.translate(to=language)
-                    translated_msg = await self._translate(msg.content, dest=language)
-                    out.append(
-                        "`{}` {}".format(
-                            language, translated_msg))
-                # except (textblob.exceptions.NotTranslated,
-                #         textblob.exceptions.TranslatorError):
-                #     pass
-                except Exception as e:
-                    print(e)
-            if len(out):
-                to_channel = self.bot.get_channel(settings.get("to_channel_id"))
-                out.insert(0,
-                           "**{}**\n`{}` {} {}".format(
-                               msg.author.display_name,
-                               detected_lang,
-                               msg.content,
-                               ' '.join([a.get('url') for a in msg.attachments])
-                           ))
-                await self.bot.send_message(to_channel, '\n'.join(out))
+        detected_lang, translations = await self.translate_languages(
+            msg.content, settings.get("languages"))
+        out = [
+            "`{}` {}".format(language, translated_msg)
+            for language, translated_msg in translations
+        ]
+        if len(out):
+            to_channel = self.bot.get_channel(settings.get("to_channel_id"))
+            out.insert(0,
+                       "**{}**\n`{}` {} {}".format(
+                           msg.author.display_name,
+                           detected_lang,
+                           msg.content,
+                           ' '.join([a.get('url') for a in msg.attachments])
+                       ))
+            await self.bot.send_message(to_channel, '\n'.join(out))
 
 
 def check_folder():
@@ -1381,6 +1381,15 @@ class RACF:
         await self.bot.delete_message(message)
         await self.bot.send_message(channel, msg)
 
+    async def set_crprofile_tag(self, ctx, crprofile, tag, member: discord.Member):
+        """Set crprofile tag unless it is already associated with member."""
+        server = ctx.message.server
+        sctag = SCTag(tag)
+        if sctag.valid and crprofile.tag_registry.member_tag(server.id, member.id) == sctag.tag:
+            await self.bot.say("CR Profile: player tag already associated with member.")
+            return
+        await ctx.invoke(crprofile.crprofile_settag, tag, member)
+
     @commands.command(pass_context=True, no_pm=True)
     async def crsettag(self, ctx, tag, member: discord.Member = None):
         """Set CR tags for members.
@@ -1419,7 +1428,7 @@ class RACF:
         if crclan is not None:
             await ctx.invoke(crclan.crclan_settag, tag, member)
         if crprofile is not None:
-            await ctx.invoke(crprofile.crprofile_settag, tag, member)
+            await self.set_crprofile_tag(ctx, crprofile, tag, member)
         if racfaudit is not None:
             success = await racfaudit.set_player_tag(tag, member)
             if success:
@@ -1475,7 +1484,7 @@ class RACF:
         if crclan is not None:
             await ctx.invoke(crclan.crclan_settag, tag, member)
         if crprofile is not None:
-            await ctx.invoke(crprofile.crprofile_settag, tag, member)
+            await self.set_crprofile_tag(ctx, crprofile, tag, member)
         if racfaudit is not None:
             success = await racfaudit.set_player_tag(tag, member, force=force)
             if success:
@@ -626,10 +626,17 @@ class RACFAudit:
                 user_id = m['user_id']
                 break
 
+        server = ctx.message.server
+        if user_id is None:
+            crprofile = self.bot.get_cog("CRProfile")
+            if crprofile is not None:
+                member_ids = crprofile.tag_registry.tag_member_ids(server.id, tag)
+                if member_ids:
+                    user_id = sorted(member_ids)[0]
+
         if user_id is None:
             await self.bot.say("Member not found.")
         else:
-            server = ctx.message.server
             member = server.get_member(user_id)
             await self.bot.say("{} ({}) is associated with #{}".format(
                 member.mention if member is not None else 'Unknown user',
@@ -652,6 +659,11 @@ class RACFAudit:
 
         if not found:
             await self.bot.say("RACF Audit database: Member is not associated with any tags.")
+            crprofile = self.bot.get_cog("CRProfile")
+            if crprofile is not None:
+                tag = crprofile.tag_registry.member_tag(ctx.message.server.id, member.id)
+                if tag is not None:
+                    await self.bot.say("CR Profile: `{}` is associated to `#{}`".format(member, tag))
 
     @racfaudit.command(name="rmtag", pass_context=True)
     # @checks.mod_or_permissions(manage_roles=True)
@@ -212,6 +212,16 @@ class RACFDecks:
         if len(decks) == 0 and show_empty:
             await self.bot.send_message(channel, "No more decks found.")
 
+        # render all deck images in one batch before posting
+        if decks and deck_cog is not None:
+            pngs = await deck_cog.deck_pngs([
+                (deck.get('deck_name').split(','), None, deck.get('player_name') or self.bot.user.name)
+                for deck in decks
+            ])
+            for png in pngs:
+                if isinstance(png, Exception):
+                    logger.error("Deck image render failed: %s", png)
+
         for deck in decks:
             card_keys = deck.get('deck_name').split(',')
             player_name = deck.get('player_name', '')
@@ -23,6 +23,8 @@ DEALINGS IN THE SOFTWARE.
 """
 
 import asyncio
+import codecs
+import heapq
 from collections import Counter
 from collections import defaultdict
 from collections import namedtuple
@@ -34,6 +36,7 @@ import datetime as dt
 import discord
 import io
 import os
+import re
 import yaml
 from addict import Dict
 from discord.ext import commands
@@ -47,6 +50,13 @@ PATH = os.path.join("data", "trade")
 JSON = os.path.join(PATH, "settings.json")
 CARDS_AKA_YML_URL = 'https://raw.githubusercontent.com/smlbiobot/SML-Cogs/master/deck/data/cards_aka.yaml'
 CARDS_JSON_URL = 'https://royaleapi.github.io/cr-api-data/json/cards.json'
+TRADE_EXPIRY = dt.timedelta(days=2).total_seconds()
+# seconds to wait for more changes before writing settings
+SAVE_DELAY = 10
+# rows between import progress updates
+IMPORT_PROGRESS_ROWS = 500
+GOOGLE_SHEET_RE = re.compile(r'docs\.google\.com/spreadsheets/d/([\w-]+)(?:.*[#&?]gid=(\d+))?')
+GOOGLE_SHEET_CSV_URL = 'https://docs.google.com/spreadsheets/d/{id}/export?format=csv&gid={gid}'
 
 
 def nested_dict():
@@ -118,71 +128,295 @@ class Settings(Dict):
         dataIO.save_json(JSON, self.to_dict())
 
     def check_server(self, server_id):
-        if not self[server_id].trades:
+        # never replace an existing dict: TradeBook keeps a reference to it
+        if "trades" not in self[server_id]:
             self[server_id].trades = dict()
 
     def reset_server(self, server_id):
         self[server_id].trades = dict()
         self.save()
 
-    def remove_old_trades(self, server_id):
-        """Look for trade items that’s older than 24 hours and remove them."""
-        now = get_now_timestamp()
-        limit = dt.timedelta(days=2).total_seconds()
-        for k, v in self[server_id].trades.copy().items():
-            if abs(now - v.get('timestamp')) > limit:
-                self[server_id].trades.pop(k)
+    def enable_auto(self, server_id, channel_id):
+        """Enable auto posting"""
+        self.check_server(server_id)
+        self[server_id].auto.enabled = True
+        self[server_id].auto.channel_id = channel_id
+        self.save()
+
+    def disable_auto(self, server_id):
+        """Disable auto posting"""
+        self.check_server(server_id)
+        self[server_id].auto.enabled = False
+        self[server_id].auto.channel_id = None
         self.save()
 
+
+class ServerTrades:
+    """Trades of a server indexed by rarity, cards and clan tag.
+
+    trades is the dict stored in settings, keyed by trade id. Expiry uses
+    a heap of (timestamp, id); entries of removed trades are skipped.
+    """
+
+    INDEX_FIELDS = ['rarity', 'give_card', 'get_card', 'clan_tag']
+
+    def __init__(self, trades):
+        self.trades = trades
+        self.indexes = {field: defaultdict(set) for field in self.INDEX_FIELDS}
+        for id_, v in trades.items():
+            self._index(id_, v)
+        self.expiry = [(v.get('timestamp'), id_) for id_, v in trades.items()]
+        heapq.heapify(self.expiry)
+
+    @staticmethod
+    def index_key(field, value):
+        if value is None:
+            return None
+        # rarity is filtered by initial
+        if field == 'rarity':
+            return value[0].lower()
+        return value
+
+    def _index(self, id_, v):
+        for field in self.INDEX_FIELDS:
+            self.indexes[field][self.index_key(field, v.get(field))].add(id_)
+
+    def add(self, id_, v):
+        if id_ in self.trades:
+            self.remove(id_)
+        self.trades[id_] = v
+        self._index(id_, v)
+        heapq.heappush(self.expiry, (v.get('timestamp'), id_))
+
+    def remove(self, id_):
+        v = self.trades.pop(id_)
+        for field in self.INDEX_FIELDS:
+            key = self.index_key(field, v.get(field))
+            ids = self.indexes[field][key]
+            ids.discard(id_)
+            if not ids:
+                del self.indexes[field][key]
+
+    def expire(self, now):
+        """Remove trades older than TRADE_EXPIRY. Return number removed."""
+        removed = 0
+        while self.expiry and self.expiry[0][0] < now - TRADE_EXPIRY:
+            timestamp, id_ = heapq.heappop(self.expiry)
+            v = self.trades.get(id_)
+            if v is not None and v.get('timestamp') == timestamp:
+                self.remove(id_)
+                removed += 1
+        return removed
+
+    def find_ids(self, **filters):
+        """Ids of trades matching all filters. None values are ignored."""
+        postings = [
+            self.indexes[field].get(self.index_key(field, value), set())
+            for field, value in filters.items() if value is not None
+        ]
+        if not postings:
+            return set(self.trades.keys())
+        postings.sort(key=len)
+        return postings[0].intersection(*postings[1:])
+
+
+class TradeBook:
+    """In-memory trade book over settings.
+
+    Changes are written behind: saves are debounced by SAVE_DELAY.
+    Expired trades are dropped lazily on read without a save; they are
+    expired again on load if the process restarts before the next save.
+    """
+
+    def __init__(self, settings: Settings, loop, save_delay=SAVE_DELAY):
+        self.settings = settings
+        self.loop = loop
+        self.save_delay = save_delay
+        self.servers = {}
+        self._save_handle = None
+
+    def server(self, server_id) -> ServerTrades:
+        if server_id not in self.servers:
+            self.settings.check_server(server_id)
+            self.servers[server_id] = ServerTrades(self.settings[server_id].trades)
+        return self.servers[server_id]
+
+    def save_later(self):
+        if self._save_handle is None:
+            self._save_handle = self.loop.call_later(self.save_delay, self.save_now)
+
+    def save_now(self):
+        if self._save_handle is not None:
+            self._save_handle.cancel()
+            self._save_handle = None
+        self.settings.save()
+
+    def reset_server(self, server_id):
+        self.servers.pop(server_id, None)
+        self.settings.reset_server(server_id)
+
     def add_trade_item(self, item: TradeItem):
         """Add trade item if valid."""
-        self.check_server(item.server_id)
-        id_ = str(item.timestamp)
         if all([item.give_card, item.get_card, item.rarity]):
-            self[item.server_id].trades[id_] = item._asdict()
-            self.save()
+            self.server(item.server_id).add(str(item.timestamp), item._asdict())
+            self.save_later()
             return True
         return False
 
+    def add_trade_items(self, items):
+        """Add valid trade items and save once. Return number added."""
+        added = 0
+        for item in items:
+            if all([item.give_card, item.get_card, item.rarity]):
+                self.server(item.server_id).add(str(item.timestamp), item._asdict())
+                added += 1
+        if added:
+            self.save_now()
+        return added
+
     def remove_trade_item(self, item: TradeItem):
-        self.check_server(item.server_id)
+        trades = self.server(item.server_id)
+        ids = trades.find_ids(
+            give_card=item.give_card,
+            get_card=item.get_card,
+            clan_tag=item.clan_tag,
+        )
+        for id_ in ids:
+            trades.remove(id_)
+        if ids:
+            self.save_later()
+        return bool(ids)
+
+    def find(self, server_id, rarity=None, give_card=None, get_card=None, clan_tag=None):
+        """Return list of unexpired trades matching filters."""
+        trades = self.server(server_id)
+        trades.expire(get_now_timestamp())
+        ids = trades.find_ids(rarity=rarity, give_card=give_card, get_card=get_card, clan_tag=clan_tag)
+        return [TradeItem(**trades.trades[id_]) for id_ in ids]
 
-        removed = False
+    def get_trades(self, server_id):
+        """Return list of trades"""
+        return self.find(server_id)
 
-        trades = self[item.server_id].trades
-        for k, v in trades.copy().items():
-            if all([
-                v.get('get_card') == item.get_card,
-                v.get('give_card') == item.give_card,
-                v.get('clan_tag') == item.clan_tag,
-            ]):
-                trades.pop(k)
-                removed = True
 
-        self.save()
+def google_sheet_csv_url(url):
+    """CSV export URL of a Google Sheet link, None if url is not one."""
+    m = GOOGLE_SHEET_RE.search(url)
+    if m is None:
+        return None
+    return GOOGLE_SHEET_CSV_URL.format(id=m.group(1), gid=m.group(2) or 0)
+
+
+class TradeImport:
+    """Parse and validate trade rows of a CSV as it is downloaded.
+
+    First row is header: give,get,clan_tag
+
+    Text is fed in chunks; complete lines are parsed right away. Lines
+    are held back while a quoted field is open so fields may contain
+    newlines.
+    """
+
+    def __init__(self, aka_to_card, card_rarities, existing: ServerTrades, server_id, author_id):
+        self.aka_to_card = aka_to_card
+        self.card_rarities = card_rarities
+        self.existing = existing
+        self.server_id = server_id
+        self.author_id = author_id
+        self.header = None
+        self.pending = ''
+        self.row_count = 0
+        self.items = []
+        self.seen = set()
+        self.duplicates = 0
+        self.errors = []
+        self.timestamp = get_now_timestamp()
+        # expired trades do not count as duplicates
+        self.existing.expire(self.timestamp)
+
+    def feed(self, text):
+        """Parse complete rows in text. Return number of rows parsed."""
+        text = self.pending + text
+        end = text.rfind('\n') + 1
+        # keep incomplete line and open quoted fields for the next chunk
+        if text.count('"', 0, end) % 2:
+            end = 0
+        self.pending = text[end:]
+        return self.parse(text[:end])
+
+    def close(self):
+        """Parse remaining text."""
+        text, self.pending = self.pending, ''
+        return self.parse(text)
+
+    def parse(self, text):
+        if not text:
+            return 0
+        rows = csv.reader(io.StringIO(text))
+        if self.header is None:
+            self.header = [field.strip().lower() for field in next(rows, [])]
+        count = 0
+        for row in rows:
+            if not any(row):
+                continue
+            self.row_count += 1
+            count += 1
+            self.add_row(self.row_count + 1, dict(zip(self.header, row)))
+        return count
+
+    def card(self, row, field):
+        s = row.get(field)
+        if s is None:
+            return None
+        return self.aka_to_card.get(s.strip().lower().replace(' ', '-'))
+
+    def add_row(self, line, row):
+        give_card = self.card(row, 'give')
+        get_card = self.card(row, 'get')
+        clan_tag = clean_tag((row.get('clan_tag') or '').strip())
+
+        unknown = [row.get(field) or '' for field, card in [('give', give_card), ('get', get_card)] if card is None]
+        if unknown:
+            self.errors.append((line, "Unknown card: {}".format(', '.join(unknown))))
+            return
+        rarity = self.card_rarities.get(give_card)
+        if rarity != self.card_rarities.get(get_card):
+            self.errors.append((line, "Rarities does not match for {} and {}".format(give_card, get_card)))
+            return
+        # clan tag is optional
+        if clan_tag and not validate_tag(clan_tag).valid:
+            self.errors.append((line, "Invalid clan tag: {}".format(row.get('clan_tag'))))
+            return
 
-        return removed
+        key = (give_card, get_card, clan_tag)
+        if key in self.seen or self.existing.find_ids(give_card=give_card, get_card=get_card, clan_tag=clan_tag):
+            self.duplicates += 1
+            return
+        self.seen.add(key)
 
-    def get_trades(self, server_id):
-        """Return list of trades"""
-        self.check_server(server_id)
-        self.remove_old_trades(server_id)
-        trades = [TradeItem(**v) for k, v in self[server_id].trades.items()]
-        return trades
+        self.items.append(
+            TradeItem(
+                server_id=self.server_id,
+                author_id=self.author_id,
+                give_card=give_card,
+                get_card=get_card,
+                clan_tag=clan_tag,
+                rarity=rarity,
+                # unique per row as timestamp is the trade id
+                timestamp=self.timestamp + len(self.items) * 1e-6
+            )
+        )
 
-    def enable_auto(self, server_id, channel_id):
-        """Enable auto posting"""
-        self.check_server(server_id)
-        self[server_id].auto.enabled = True
-        self[server_id].auto.channel_id = channel_id
-        self.save()
-
-    def disable_auto(self, server_id):
-        """Disable auto posting"""
-        self.check_server(server_id)
-        self[server_id].auto.enabled = False
-        self[server_id].auto.channel_id = None
-        self.save()
+    def summary(self):
+        o = [
+            "Rows: {}".format(self.row_count),
+            "Imported: {}".format(len(self.items)),
+            "Duplicates: {}".format(self.duplicates),
+            "Errors: {}".format(len(self.errors)),
+        ]
+        for line, error in self.errors:
+            o.append("Row {}: {}".format(line, error))
+        return o
 
 
 class Trade:
@@ -192,9 +426,14 @@ class Trade:
         """Init."""
         self.bot = bot
         self.settings = Settings(dataIO.load_json(JSON))
+        self.book = TradeBook(self.settings, self.bot.loop)
         self._cards_aka = None
         self._aka_to_card = None
         self._cards_constants = None
+        self._card_rarities = None
+
+    def __unload(self):
+        self.book.save_now()
 
     async def get_cards_aka(self):
         if self._cards_aka is None:
@@ -204,8 +443,8 @@ class Trade:
                     self._cards_aka = yaml.load(data)
         return self._cards_aka
 
-    async def aka_to_card(self, abbreviation):
-        """Go through all abbreviation to find card dict"""
+    async def get_aka_to_card(self):
+        """Dict of card keys and abbreviations to card keys."""
         if self._aka_to_card is None:
             akas = await self.get_cards_aka()
             self._aka_to_card = dict()
@@ -217,7 +456,11 @@ class Trade:
                     self._aka_to_card[k.replace('-', '')] = k
                 for item in v:
                     self._aka_to_card[item] = k
-        return self._aka_to_card.get(abbreviation)
+        return self._aka_to_card
+
+    async def aka_to_card(self, abbreviation):
+        """Go through all abbreviation to find card dict"""
+        return (await self.get_aka_to_card()).get(abbreviation)
 
     async def get_cards_constants(self):
         if self._cards_constants is None:
@@ -226,22 +469,22 @@ class Trade:
                     self._cards_constants = await resp.json()
         return self._cards_constants
 
+    async def get_card_rarities(self):
+        """Dict of card keys to rarity."""
+        if self._card_rarities is None:
+            self._card_rarities = {
+                c.get('key'): c.get('rarity') for c in await self.get_cards_constants()
+            }
+        return self._card_rarities
+
     async def check_cards(self, cards=None):
         """Make sure all cards have the same rarity."""
-        rarities = []
-        for c in await self.get_cards_constants():
-            for card in cards:
-                if c.get('key') == card:
-                    rarities.append(c.get('rarity'))
-        if len(set(rarities)) == 1:
-            return True
-        return False
+        card_rarities = await self.get_card_rarities()
+        rarities = {card_rarities[card] for card in cards if card in card_rarities}
+        return len(rarities) == 1
 
     async def get_rarity(self, card):
-        for c in await self.get_cards_constants():
-            if c.get('key') == card:
-                return c.get('rarity')
-        return None
+        return (await self.get_card_rarities()).get(card)
 
     def get_emoji(self, name):
         """Return emoji by name."""
@@ -262,7 +505,7 @@ class Trade:
     async def reset_server_trades(self, ctx):
         """Reset all trades on server."""
         server = ctx.message.server
-        self.settings.reset_server(server.id)
+        self.book.reset_server(server.id)
         await self.bot.say("Server trades reset: all trades removed.")
 
     @checks.mod_or_permissions()
@@ -316,14 +559,13 @@ class Trade:
 
         rarity = rarities[0]
 
-        self.settings.add_trade_item(TradeItem(server_id=server.id,
-                                               author_id=author.id,
-                                               give_card=give_card,
-                                               get_card=get_card,
-                                               clan_tag=clan_tag,
-                                               rarity=rarity,
-                                               timestamp=get_now_timestamp()))
-        self.settings.save()
+        self.book.add_trade_item(TradeItem(server_id=server.id,
+                                           author_id=author.id,
+                                           give_card=give_card,
+                                           get_card=get_card,
+                                           clan_tag=clan_tag,
+                                           rarity=rarity,
+                                           timestamp=get_now_timestamp()))
         await self.bot.say(
             "Give: {give_card}, Get: {get_card}, {clan_tag}, {rarity}".format(
                 give_card=give_card,
@@ -348,85 +590,70 @@ class Trade:
             get_card=get_card,
             clan_tag=clan_tag
         )
-        if self.settings.remove_trade_item(trade_item):
+        if self.book.remove_trade_item(trade_item):
             await self.bot.say('Trade removed')
         else:
             await self.bot.say("Cannot find your trade.")
 
     @trade.command(name="import", aliases=['i'], pass_context=True)
-    async def import_trade(self, ctx):
-        """Import list of trades from CSV file.
+    async def import_trade(self, ctx, url=None):
+        """Import list of trades from CSV file or Google Sheet.
 
+        Attach a CSV or give a link to a shared Google Sheet.
         First row is header:
         give,get,clan_tag
         """
-        if len(ctx.message.attachments) == 0:
+        if url is not None:
+            url = google_sheet_csv_url(url) or url
+        elif len(ctx.message.attachments):
+            url = ctx.message.attachments[0]["url"]
+        else:
             await self.bot.say(
-                "Please attach CSV with this command. "
+                "Please attach CSV or add a Google Sheet link with this command. "
             )
             return
 
-        attach = ctx.message.attachments[0]
-        url = attach["url"]
-
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                data = await resp.text()
-
-        reader = csv.DictReader(io.StringIO(data))
-
-        async def get_field(row, field, is_card=False, is_clan_tag=False):
-            s = row.get(field)
-            v = None
-            if s is None:
-                return None
-            s = s.strip()
-            if is_card:
-                s = s.lower().replace(' ', '-')
-                v = await self.aka_to_card(s)
-            elif is_clan_tag:
-                v = clean_tag(s)
-            return v
-
-        trade_items = []
-
         server = ctx.message.server
         author = ctx.message.author
 
-        for row in reader:
-            # normalize string
-            give_card = await get_field(row, 'give', is_card=True)
-            get_card = await get_field(row, 'get', is_card=True)
-            clan_tag = await get_field(row, 'clan_tag', is_clan_tag=True)
-
-            # validate rarities
-            rarities = []
-            for c in [give_card, get_card]:
-                rarities.append(await self.get_rarity(c))
-
-            if len(set(rarities)) != 1:
-                await self.bot.say("Rarities does not match for {} and {}".format(give_card, get_card))
-
-            else:
-                trade_items.append(
-                    TradeItem(
-                        server_id=server.id,
-                        author_id=author.id,
-                        give_card=give_card,
-                        get_card=get_card,
-                        clan_tag=clan_tag,
-                        rarity=rarities[0],
-                        timestamp=get_now_timestamp()
-                    )
-                )
+        trade_import = TradeImport(
+            await self.get_aka_to_card(),
+            await self.get_card_rarities(),
+            self.book.server(server.id),
+            server.id,
+            author.id
+        )
 
-        for item in trade_items:
-            self.settings.add_trade_item(item)
+        progress = await self.bot.say("Importing trades…")
+        next_progress = IMPORT_PROGRESS_ROWS
 
-        self.settings.save()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get(url) as resp:
+                    if resp.status != 200:
+                        await self.bot.edit_message(
+                            progress, "Cannot download CSV: HTTP {}".format(resp.status))
+                        return
+                    decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='replace')
+                    async for chunk in resp.content.iter_any():
+                        trade_import.feed(decoder.decode(chunk))
+                        if trade_import.row_count >= next_progress:
+                            next_progress = trade_import.row_count + IMPORT_PROGRESS_ROWS
+                            await self.bot.edit_message(
+                                progress, "Importing trades… {} rows".format(trade_import.row_count))
+                    trade_import.feed(decoder.decode(b'', final=True))
+                    trade_import.close()
+        except aiohttp.ClientError as e:
+            await self.bot.edit_message(progress, "Cannot download CSV: {}".format(e))
+            return
 
-        o = ["Give: {give_card}, Get: {get_card}, {clan_tag}".format(**item._asdict()) for item in trade_items]
-        for page in pagify("\n".join(o)):
+        # one write for the whole import
+        self.book.add_trade_items(trade_import.items)
+
+        await self.bot.edit_message(
+            progress, "Imported {} of {} rows.".format(len(trade_import.items), trade_import.row_count))
+
+        for page in pagify("\n".join(trade_import.summary())):
             await self.bot.say(page)
 
     @trade.command(name="list", aliases=['l'], pass_context=True)
@@ -465,40 +692,25 @@ class Trade:
     async def get_filtered_list(self, server: discord.Server = None, rarity=None, give_card=None, get_card=None,
                                 clan_tag=None):
         """Return filtered list items"""
-        items = self.settings.get_trades(server.id)
-
-        included_items = []
-
-        for item in items:
-            # skip invalid items
-            if not all([item.give_card, item.get_card, item.rarity]):
-                continue
-
-            # filter rarities
-            if rarity is not None:
-                if item.rarity[0].lower() != rarity.lower():
-                    continue
-
-            # filter give
-            if give_card is not None:
-                card = await self.aka_to_card(give_card)
-                if item.give_card != card:
-                    continue
-
-            # filter get
-            if get_card is not None:
-                card = await self.aka_to_card(get_card)
-                if item.get_card != card:
-                    continue
-
-            # filter clan_tag
-            if clan_tag is not None:
-                if item.clan_tag != clan_tag:
-                    continue
-
-            included_items.append(item)
+        if give_card is not None:
+            give_card = await self.aka_to_card(give_card)
+            if give_card is None:
+                return []
+        if get_card is not None:
+            get_card = await self.aka_to_card(get_card)
+            if get_card is None:
+                return []
+
+        items = self.book.find(
+            server.id,
+            rarity=rarity,
+            give_card=give_card,
+            get_card=get_card,
+            clan_tag=clan_tag
+        )
 
-        return included_items
+        # skip invalid items
+        return [item for item in items if all([item.give_card, item.get_card, item.rarity])]
 
     @trade.command(name="get", aliases=['gt'], pass_context=True)
     async def list_get_card(self, ctx, card):
@@ -550,7 +762,7 @@ class Trade:
     async def trade_info(self, ctx):
         """List DB info."""
         server = ctx.message.server
-        items = self.settings.get_trades(server.id)
+        items = self.book.get_trades(server.id)
 
         author_ids = [item.author_id for item in items]
         o = []
@@ -612,13 +824,13 @@ class Trade:
 
     async def auto_post_trades(self):
         """Post trades to channel."""
-        for server_id, v in self.settings.items():
-            self.settings.remove_old_trades(server_id)
+        for server_id, v in list(self.settings.items()):
+            trades = self.book.get_trades(server_id)
             if v.auto and v.auto.enabled:
                 channel_id = v.auto.channel_id
                 channel = self.bot.get_channel(channel_id)
                 if channel is not None:
-                    msg = await self.send_trade_list(channel, self.settings.get_trades(server_id))
+                    msg = await self.send_trade_list(channel, trades)
 
                     # delete channel messages
                     await self.bot.purge_from(channel, limit=100, before=msg)